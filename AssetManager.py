@@ -0,0 +1,164 @@
+#!/usr/bin/python
+
+#------------------------------------------------------------
+# IMPORTS
+#------------------------------------------------------------
+
+# External modules
+import os
+import pygame
+from collections import OrderedDict
+
+# Internal modules
+import config
+
+#------------------------------------------------------------
+# Caches
+
+# key -> surface, least recently used first
+surfaces = OrderedDict()
+# key -> bytes held by surface
+surfaceBytes = {}
+# path -> modification time when decoded
+decodedTimes = {}
+# bytes held by all cached surfaces
+totalBytes = 0
+
+#------------------------------------------------------------
+# Functions
+
+def sizeOf(surface):
+    '''bytes of pixel data held by a surface'''
+    return(surface.get_pitch() * surface.get_height())
+
+def store(key, surface):
+    '''adds a surface to the cache, dropping least recently used to fit'''
+    global totalBytes
+    # replace any earlier entry
+    discard(key)
+    surfaces[key] = surface
+    surfaceBytes[key] = sizeOf(surface)
+    totalBytes += surfaceBytes[key]
+    # drop least recently used, never the surface just added
+    while totalBytes > config.assetCacheBytes and len(surfaces) > 1:
+        discard(next(iter(surfaces)))
+
+def discard(key):
+    '''removes a surface from the cache'''
+    global totalBytes
+    if key in surfaces:
+        del surfaces[key]
+        totalBytes -= surfaceBytes.pop(key)
+
+def clear():
+    '''empties the cache, for example after the display mode changes'''
+    for key in list(surfaces):
+        discard(key)
+    decodedTimes.clear()
+
+def getOrMake(key, builder):
+    '''cached surface for key, made by builder() on a miss'''
+    # cached surface
+    surface = surfaces.get(key)
+    if surface is not None:
+        surfaces.move_to_end(key)
+        return(surface)
+    # new surface
+    surface = builder()
+    store(key, surface)
+    return(surface)
+
+def loadImage(path):
+    '''decodes an image file once.
+    Files rewritten on disk are decoded again.'''
+    key = (path, None, 0, None)
+    # changed file invalidates every surface made from it
+    mtime = os.path.getmtime(path)
+    if decodedTimes.get(path) != mtime:
+        for oldKey in [k for k in surfaces if k[0] == path]:
+            discard(oldKey)
+        decodedTimes[path] = mtime
+    return(getOrMake(key, lambda: pygame.image.load(path)))
+
+def getImage(path, size=None, rotation=0, pixelFormat=None, smooth=False):
+    '''image scaled to size (width,height), then rotated by rotation
+    degrees, then converted to pixelFormat ('alpha', 'opaque' or None).
+    Surfaces are shared, so callers must not draw on them.'''
+    # decoded image, also checks the file is unchanged
+    image = loadImage(path)
+    # no change asked for
+    if size == image.get_size():
+        size = None
+    if size is None and rotation == 0 and pixelFormat is None:
+        return(image)
+    # smooth and plain scaling differ
+    scale = None if size is None else (size, smooth)
+    key = (path, scale, rotation, pixelFormat)
+    def build():
+        surface = image
+        # scale
+        if size is not None and (rotation != 0 or pixelFormat is not None):
+            # scaled copy is shared by every angle and format
+            surface = getImage(path, size, 0, None, smooth)
+        elif size is not None and smooth:
+            surface = pygame.transform.smoothscale(surface, size)
+        elif size is not None:
+            surface = pygame.transform.scale(surface, size)
+        # rotate
+        if rotation != 0:
+            surface = pygame.transform.rotate(surface, rotation)
+        # match display pixel format for fast blits
+        if pixelFormat == 'alpha':
+            surface = surface.convert_alpha()
+        elif pixelFormat == 'opaque':
+            surface = surface.convert()
+        return(surface)
+    return(getOrMake(key, build))
+
+#------------------------------------------------------------
+# ROTATION CACHE
+#------------------------------------------------------------
+
+#------------------------------------------------------------
+# Rotation cache
+class RotationCache:
+    """Copies of one image at fixed angular steps.
+    Angles are rounded to the nearest of numAngles steps, so a
+    sprite turned every frame is looked up instead of rotated.
+    Frames are made on first use, or all at once by warm()."""
+    def __init__(self,path,size,baseRotation=0,numAngles=config.rotationSteps,pixelFormat='alpha',smooth=True):
+        # store parameters
+        self.path = path
+        self.size = size
+        self.baseRotation = baseRotation
+        self.numAngles = numAngles
+        self.pixelFormat = pixelFormat
+        self.smooth = smooth
+        # degrees per step
+        self.step = 360.0 / numAngles
+        # rotated frames, None until made
+        self.frames = [None] * numAngles
+
+    def index(self,degrees):
+        # nearest step, any angle
+        return(int(round(degrees / self.step)) % self.numAngles)
+
+    def makeFrame(self,i):
+        # rotated frame shared through the surface cache
+        rotation = (self.baseRotation + i*self.step) % 360
+        self.frames[i] = getImage(self.path, self.size, rotation, self.pixelFormat, self.smooth)
+        return(self.frames[i])
+
+    def get(self,degrees):
+        '''image rotated by degrees, to the nearest step'''
+        i = self.index(degrees)
+        frame = self.frames[i]
+        if frame is None:
+            frame = self.makeFrame(i)
+        return(frame)
+
+    def warm(self):
+        '''makes every frame now, for example at level start'''
+        for i in range(self.numAngles):
+            if self.frames[i] is None:
+                self.makeFrame(i)
@@ -0,0 +1,299 @@
+#!/usr/bin/python
+'''Times the drawing, simulation, level making and menu hot paths.
+Runs without a window, writes the results as JSON and compares them
+with an earlier run:
+    python Benchmarks.py --output new.json --baseline old.json
+Exits with status 1 if any benchmark is slower than its baseline by
+more than the threshold.'''
+
+#------------------------------------------------------------
+# IMPORTS
+#------------------------------------------------------------
+
+# External modules
+import argparse
+import json
+from math import pi
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+# no window, set before pygame starts
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame
+
+# Internal modules
+import config
+# saves go to a scratch folder, set before the modules below read the locations
+scratchFolder = tempfile.mkdtemp(prefix='SpacePostBench')
+config.dataLocation = os.path.join(scratchFolder, 'data.json')
+config.journalLocation = os.path.join(scratchFolder, 'data.journal')
+config.scoreDatabaseLocation = os.path.join(scratchFolder, 'scores.sqlite')
+import DataHands
+import LevelsLoader
+import MenuMaker
+import SpaceDelivery
+import SpaceModel
+
+#------------------------------------------------------------
+# Parameters
+
+# screen size, as in the SpaceDelivery test run
+screenSize = (1240, 880)
+# training level with post boxes and asteroids
+benchLevel = 6
+# fixed layout and looks
+benchSeed = 12345
+# objects per random level, each on a board that fits them
+randomCounts = [4, 16, 64]
+# seconds each timing repeat should take at least
+minRepeatSeconds = 0.05
+# timing repeats, the fastest is reported
+numRepeats = 5
+# slowdown allowed against the baseline, separate runs on one machine differ by up to a third
+defaultThreshold = 0.5
+
+#------------------------------------------------------------
+# BENCHMARKS
+#------------------------------------------------------------
+# Each benchmark is a setup function returning the call to time.
+# Setup runs once and is not timed.
+
+def makeGame(easyControls=True):
+    # training level, also sets the view globals
+    game = SpaceDelivery.GameInstance(pygame.display.get_surface(), 'training', benchLevel, benchSeed)
+    # chosen control scheme, whatever the saved setting
+    sim = SpaceDelivery.GameSimulation(game.level, easyControls)
+    view = game.makeView(benchSeed, sim)
+    # first frame draws everything
+    view.redraw()
+    return(sim, view)
+
+def shuttle(ship, board, speed=2.0):
+    # easy controls flying back and forth across the middle of the board
+    if ship.x_loc > 0.6*board.xmax:
+        targetVel = -speed
+    elif ship.x_loc < 0.4*board.xmax:
+        targetVel = speed
+    else:
+        targetVel = speed if ship.x_vel >= 0 else -speed
+    # thrust towards the target speed
+    ship.moveRight = ship.x_vel < targetVel
+    ship.moveLeft = not ship.moveRight
+
+def firstDrawer(view, drawerClass):
+    # first drawer of a type on the level
+    return([obj for obj in view.spaceObjects if isinstance(obj, drawerClass)][0])
+
+def benchRedrawFull():
+    sim, view = makeGame()
+    def work():
+        view.invalidate()
+        view.redraw()
+    return(work)
+
+def benchRedrawDirty():
+    sim, view = makeGame()
+    def work():
+        # ship moves a little every frame
+        shuttle(sim.postShip, sim.board)
+        sim.step()
+        view.redraw()
+    return(work)
+
+def benchMapBoard():
+    sim, view = makeGame()
+    return(lambda: view.board.drawMapBoard(view.staticLayer))
+
+def benchBoundaries():
+    sim, view = makeGame()
+    return(lambda: view.board.drawBoundaries(view.staticLayer))
+
+def benchText():
+    sim, view = makeGame()
+    return(lambda: view.board.drawText(False))
+
+def benchPostShipEasy():
+    sim, view = makeGame(True)
+    return(lambda: view.postShip.drawPostShip(0.5))
+
+def benchPostShipHard():
+    sim, view = makeGame(False)
+    ship = sim.postShip
+    def work():
+        # turning ship with the engine on
+        ship.radians = (ship.radians + 0.05) % (2*pi)
+        ship.move = True
+        view.postShip.drawPostShip(0.5)
+    return(work)
+
+def benchPostBox():
+    sim, view = makeGame()
+    drawer = firstDrawer(view, SpaceDelivery.PostBoxDrawer)
+    return(lambda: drawer.draw(view.staticLayer))
+
+def benchAsteroid():
+    sim, view = makeGame()
+    drawer = firstDrawer(view, SpaceDelivery.AsteroidHazardDrawer)
+    return(lambda: drawer.draw(view.staticLayer))
+
+def benchWarpOut():
+    sim, view = makeGame()
+    return(lambda: view.warpOut.draw(view.staticLayer))
+
+def benchTimeStep():
+    sim, view = makeGame()
+    ship = sim.postShip
+    def work():
+        shuttle(ship, sim.board)
+        ship.timeStep(config.dt)
+    return(work)
+
+def benchCheckEnd(numObjects):
+    def setup():
+        # busy boards use the array checks
+        side = boardSide(numObjects)
+        level = LevelsLoader.randomLevel(side, side, numObjects//2, numObjects - numObjects//2, rng=random.Random(benchSeed))
+        sim = SpaceModel.SimulationInstance(level)
+        ship = sim.postShip
+        def work():
+            # ship moves every call, so no distances are reused from the last one
+            shuttle(ship, sim.board)
+            ship.timeStep(config.dt)
+            sim.checkEndGameConditions()
+        return(work)
+    return(setup)
+
+def boardSide(numObjects):
+    # square board with room for every object at the random level spacing
+    return(int(2 * config.randomLevelSpacing * (numObjects + 2)**0.5) + 2)
+
+def benchRandomLevel(numObjects):
+    def setup():
+        side = boardSide(numObjects)
+        numPostBox = numObjects//2
+        numAsteroid = numObjects - numPostBox
+        # same layout every call
+        return(lambda: LevelsLoader.randomLevel(side, side, numPostBox, numAsteroid, rng=random.Random(benchSeed)))
+    return(setup)
+
+def benchCreateView(levelType):
+    def setup():
+        numLevel = benchLevel if levelType == 'training' else 0
+        game = SpaceDelivery.GameInstance(pygame.display.get_surface(), levelType, numLevel, benchSeed)
+        # scaled assets are cached after the first build, as in play
+        return(game.createView)
+    return(setup)
+
+def benchMenuDrawer(background):
+    def setup():
+        screen = pygame.display.get_surface()
+        backgroundImage = screen.copy() if background == 'surface' else config.welcomeMenuBack
+        # end-of-level menu
+        menu = MenuMaker.MenuInstance(screen, 'Good work!', 'All mail delivered in 12.3sec', ['Menu','New','Replay'], backgroundImage)
+        return(lambda: MenuMaker.MenuDrawer('Good work!', 'All mail delivered in 12.3sec', backgroundImage, menu.buttons, random.Random(benchSeed)))
+    return(setup)
+
+# name -> setup
+benchmarks = [
+    ('redraw.full', benchRedrawFull),
+    ('redraw.dirty', benchRedrawDirty),
+    ('draw.mapBoard', benchMapBoard),
+    ('draw.boundaries', benchBoundaries),
+    ('draw.text', benchText),
+    ('draw.postShipEasy', benchPostShipEasy),
+    ('draw.postShipHard', benchPostShipHard),
+    ('draw.postBox', benchPostBox),
+    ('draw.asteroid', benchAsteroid),
+    ('draw.warpOut', benchWarpOut),
+    ('model.timeStep', benchTimeStep),
+    ] + [('model.checkEndGameConditions.%d' % n, benchCheckEnd(n)) for n in randomCounts
+    ] + [('level.randomLevel.%d' % n, benchRandomLevel(n)) for n in randomCounts] + [
+    ('level.createView.training', benchCreateView('training')),
+    ('level.createView.random', benchCreateView('random')),
+    ('menu.MenuDrawer.surface', benchMenuDrawer('surface')),
+    ('menu.MenuDrawer.file', benchMenuDrawer('file')),
+    ]
+
+#------------------------------------------------------------
+# TIMING
+#------------------------------------------------------------
+
+def timeCall(work, repeats=numRepeats):
+    '''seconds per call, fastest and median of the repeats'''
+    # calls per repeat, enough to outlast timer noise
+    timer = timeit.Timer(work)
+    number, seconds = timer.autorange()
+    number = max(1, int(number * minRepeatSeconds / max(seconds, 1e-9)))
+    times = sorted([t / number for t in timer.repeat(repeats, number)])
+    return({'best': times[0], 'median': times[len(times)//2], 'number': number, 'repeats': repeats})
+
+def runBenchmarks(pattern=None, repeats=numRepeats):
+    '''results of every benchmark whose name contains pattern'''
+    # display for convert() and the view globals
+    pygame.init()
+    pygame.display.set_mode(screenSize)
+    results = {}
+    for name, setup in benchmarks:
+        if pattern is not None and pattern not in name:
+            continue
+        results[name] = timeCall(setup(), repeats)
+    return(results)
+
+def teardown():
+    # write anything queued, then drop the scratch folder with it
+    DataHands.store.shutdown()
+    pygame.display.quit()
+    shutil.rmtree(scratchFolder, ignore_errors=True)
+
+def compare(results, baseline, threshold=defaultThreshold):
+    '''(name, ratio, regressed) for benchmarks in both runs.
+    The fastest repeat is compared, it is the least noisy.'''
+    rows = []
+    for name in sorted(results):
+        if name in baseline:
+            ratio = results[name]['best'] / baseline[name]['best']
+            rows.append((name, ratio, ratio > 1 + threshold))
+    return(rows)
+
+#------------------------------------------------------------
+# run
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the game hot paths without a window.')
+    parser.add_argument('--output', help='write JSON results to this file instead of the screen')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=defaultThreshold, help='allowed slowdown, 0.5 is 50%% slower')
+    parser.add_argument('--repeats', type=int, default=numRepeats, help='timing repeats per benchmark')
+    parser.add_argument('--only', help='only run benchmarks whose name contains this')
+    args = parser.parse_args()
+    # run
+    results = runBenchmarks(args.only, args.repeats)
+    report = {'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'python': platform.python_version(),
+                       'pygame': pygame.version.ver,
+                       'platform': platform.platform(),
+                       'videoDriver': os.environ['SDL_VIDEODRIVER']},
+              'results': results}
+    # store
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    # compare, on stderr so stdout stays JSON
+    regressed = False
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+        for name, ratio, slower in compare(results, baseline, args.threshold):
+            sys.stderr.write('%-40s %6.2fx%s\n' % (name, ratio, '  REGRESSION' if slower else ''))
+            regressed = regressed or slower
+    teardown()
+    sys.exit(1 if regressed else 0)
@@ -5,12 +5,24 @@
 #------------------------------------------------------------
 
 # External modules
+import atexit
 import json
+from math import log
 import os.path
+import queue
+import threading
 
 # Internal modules
 import config
 
+# Optional modules
+try:
+    # score database, needs sqlite3
+    import ScoreDatabase
+except ImportError:
+    # scores only kept in the data file
+    ScoreDatabase = None
+
 #------------------------------------------------------------
 # Functions
 
@@ -27,6 +39,9 @@ def reset():
     for i in range(config.numLevelsMade):
         data['easyLevelRecords'].append([])
         data['hardLevelRecords'].append([])
+    # running summaries of all times ever recorded
+    data['easyLevelStats'] = [LevelStats().values for i in range(config.numLevelsMade)]
+    data['hardLevelStats'] = [LevelStats().values for i in range(config.numLevelsMade)]
     
     # total number of deliveries attempted
     data['numAttempts'] = 0
@@ -39,6 +54,9 @@ def reset():
     # total number of deliveries complete
     data['numComplete'] = 0
     
+    # last journal entry included
+    data['journalSeq'] = 0
+    
     # return dataset
     return(data)
 
@@ -56,7 +74,396 @@ def loadJson():
 
 def saveJson(data):
     '''saves data file to JSON'''
-    # Writing JSON data
-    with open(config.dataLocation, 'w') as f:
-        json.dump(data, f)
+    saveText(json.dumps(data))
+
+def saveText(text):
+    '''saves data file already turned into JSON text'''
+    # write then rename so a crash never leaves half a file
+    tmpLocation = config.dataLocation + '.tmp'
+    with open(tmpLocation, 'w') as f:
+        f.write(text)
+    os.replace(tmpLocation, config.dataLocation)
+
+def loadJournal():
+    '''reads journal entries, dropping a half written last line'''
+    entries = []
+    if os.path.isfile(config.journalLocation):
+        with open(config.journalLocation, 'r') as f:
+            lines = f.readlines()
+        for line in lines:
+            # complete entries end with a newline
+            entry = None
+            if line.endswith('\n'):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None
+            # cut off the damage so later appends start on a clean line
+            if entry is None:
+                with open(config.journalLocation, 'w') as f:
+                    f.writelines(lines[:len(entries)])
+                break
+            entries.append(entry)
+    return(entries)
+
+def appendJournal(entries):
+    '''adds entries to the end of the journal'''
+    with open(config.journalLocation, 'a') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + '\n')
+
+def buildStats(data):
+    '''adds level summaries to a dataset saved before they existed'''
+    for mode in ['easy','hard']:
+        data[mode + 'LevelStats'] = []
+        for records in data[mode + 'LevelRecords']:
+            stats = LevelStats()
+            for seconds in records:
+                stats.add(seconds)
+            data[mode + 'LevelStats'].append(stats.values)
+
+#------------------------------------------------------------
+# Level statistics
+
+class LevelStats:
+    """Running summary of the times recorded on one level.
+    Count, best, mean and variance (Welford) are updated per time,
+    percentiles come from a fixed histogram with bins evenly spaced
+    in log time, so memory and cost stay constant however many
+    times are added. Wraps a plain dict so it saves with the data."""
+    def __init__(self,values=None):
+        # new summary
+        if values is None:
+            values = {'count': 0, 'best': None, 'mean': 0.0, 'm2': 0.0, 'bins': [0]*config.statsBins}
+        self.values = values
+        
+    def binIndex(self,seconds):
+        # position in log time between the histogram limits
+        low = log(config.statsMinSeconds)
+        high = log(config.statsMaxSeconds)
+        position = (log(max(seconds, config.statsMinSeconds)) - low) / (high - low)
+        # clamp into histogram
+        return(min(int(position * config.statsBins), config.statsBins - 1))
+        
+    def binMiddle(self,i):
+        # geometric middle of bin i
+        ratio = config.statsMaxSeconds / config.statsMinSeconds
+        return(config.statsMinSeconds * ratio**((i + 0.5) / config.statsBins))
+        
+    def add(self,seconds):
+        values = self.values
+        # count and best
+        values['count'] += 1
+        if values['best'] is None or seconds < values['best']:
+            values['best'] = seconds
+        # running mean and sum of squared differences
+        change = seconds - values['mean']
+        values['mean'] += change / values['count']
+        values['m2'] += change * (seconds - values['mean'])
+        # histogram
+        values['bins'][self.binIndex(seconds)] += 1
+        
+    def count(self):
+        return(self.values['count'])
+        
+    def best(self):
+        return(self.values['best'])
+        
+    def mean(self):
+        return(self.values['mean'])
+        
+    def variance(self):
+        # sample variance, zero until two times
+        if self.values['count'] < 2:
+            return(0.0)
+        return(self.values['m2'] / (self.values['count'] - 1))
+        
+    def percentile(self,fraction):
+        '''approximate time that fraction of the times are below'''
+        if self.values['count'] == 0:
+            return(None)
+        # walk histogram up to the wanted count
+        target = fraction * self.values['count']
+        total = 0
+        for i in range(config.statsBins):
+            total += self.values['bins'][i]
+            if total >= target and total > 0:
+                return(self.binMiddle(i))
+        return(self.binMiddle(config.statsBins - 1))
+        
+    def fasterThan(self,seconds):
+        '''approximate fraction of times slower than seconds'''
+        if self.values['count'] == 0:
+            return(0.0)
+        # slower bins, plus half of the shared bin
+        i = self.binIndex(seconds)
+        slower = sum(self.values['bins'][i+1:]) + 0.5*self.values['bins'][i]
+        return(slower / self.values['count'])
+
+#------------------------------------------------------------
+# Background writer
+
+class DataWriter:
+    """Writes the data file and journal on a background thread.
+    Jobs are ('append', entries) or ('snapshot', json text, attempts),
+    the attempts being those the snapshot holds that were never appended. Everything
+    queued when the thread wakes is written together: only the latest
+    snapshot is written, appends it covers are skipped and the rest go
+    out in one write. Attempts are also added to the score database
+    when config.useScoreDatabase is set."""
+    def __init__(self,size=config.writerQueueSize):
+        # bounded so a stuck disk cannot hold unlimited data
+        self.queue = queue.Queue(size)
+        # started on first job
+        self.thread = None
+        # opened on the writer thread
+        self.database = None
+        # last failed write, cleared by the store when it retries
+        self.error = None
+        
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='DataWriter')
+            self.thread.daemon = True
+            self.thread.start()
+            
+    def submit(self,job,block=False):
+        '''queues a job, False if the queue is full'''
+        self.start()
+        try:
+            self.queue.put(job, block)
+        except queue.Full:
+            return(False)
+        return(True)
+        
+    def run(self):
+        running = True
+        while running:
+            # wait for work then take everything queued
+            jobs = [self.queue.get()]
+            while True:
+                try:
+                    jobs.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            # None asks the thread to stop, it is always the last job
+            if jobs[-1] is None:
+                running = False
+            # write batch
+            try:
+                self.write([job for job in jobs if job is not None])
+            except (IOError, OSError) as error:
+                # data is still held in memory, the store writes a snapshot on its next flush
+                self.error = error
+            for job in jobs:
+                self.queue.task_done()
+        # connection belongs to this thread
+        if self.database is not None:
+            self.database.close()
+            self.database = None
+                
+    def write(self,jobs):
+        # every attempt goes to the database, even those a snapshot covers
+        if config.useScoreDatabase and ScoreDatabase is not None:
+            attempts = []
+            for job in jobs:
+                if job[0] == 'append':
+                    attempts += [entry for entry in job[1] if entry['op'] == 'attempt']
+                else:
+                    attempts += job[2]
+            if attempts:
+                try:
+                    if self.database is None:
+                        self.database = ScoreDatabase.ScoreDatabase()
+                    self.database.addAttempts(attempts)
+                except ScoreDatabase.DatabaseError:
+                    # data file and journal still hold every attempt
+                    pass
+        # latest snapshot covers every earlier job
+        snapshots = [i for i in range(len(jobs)) if jobs[i][0] == 'snapshot']
+        if snapshots:
+            saveText(jobs[snapshots[-1]][1])
+            # snapshot written, journal can be emptied
+            open(config.journalLocation, 'w').close()
+            jobs = jobs[snapshots[-1]+1:]
+        # remaining appends in one write
+        entries = []
+        for job in jobs:
+            entries += job[1]
+        if entries:
+            appendJournal(entries)
+            
+    def wait(self):
+        '''blocks until every queued job is written'''
+        if self.thread is not None:
+            self.queue.join()
+            
+    def stop(self):
+        '''writes everything queued then ends the thread'''
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+#------------------------------------------------------------
+# Session store
+
+class DataStore:
+    """In-memory copy of the data file for the whole session.
+    The data file is a snapshot, every change after it is appended to
+    a journal, so a save costs the same however long the records are.
+    The snapshot records the last journal entry it includes. Once the
+    journal is long it is folded into a new snapshot and emptied.
+    Files are written by a DataWriter so saving never waits on disk."""
+    def __init__(self):
+        # parsed data, None until first used
+        self.data = None
+        # journal entries not yet written
+        self.pending = []
+        # entries in journal file
+        self.journalLength = 0
+        # last journal sequence number
+        self.seq = 0
+        # snapshot must be rewritten
+        self.dirty = False
+        # background writes
+        self.writer = DataWriter()
+        
+    def load(self):
+        '''parses the data file and replays the journal once per session'''
+        if self.data is None:
+            self.data = loadJson()
+            self.seq = self.data.get('journalSeq', 0)
+            # data saved before level summaries, saved with the next snapshot
+            if 'easyLevelStats' not in self.data:
+                buildStats(self.data)
+            # changes since the snapshot
+            entries = loadJournal()
+            for entry in entries:
+                if entry['seq'] > self.seq:
+                    self.apply(entry)
+                    self.seq = entry['seq']
+            self.journalLength = len(entries)
+        return(self.data)
+        
+    def apply(self,entry):
+        # change data without journaling
+        op = entry['op']
+        if op == 'set':
+            self.data[entry['key']] = entry['value']
+        elif op == 'increment':
+            self.data[entry['key']] += entry['amount']
+        elif op == 'attempt':
+            # outcome count
+            if entry['outcome'] == 'lost':
+                self.data['numLost'] += 1
+            elif entry['outcome'] == 'crashed':
+                self.data['numCrashes'] += 1
+            elif entry['outcome'] == 'early':
+                self.data['numEarly'] += 1
+            elif entry['outcome'] == 'complete':
+                self.data['numComplete'] += 1
+            # training level times
+            if entry['outcome'] == 'complete' and entry['gameType'] == 'training':
+                records, stats = self.levelSlots(entry['easyControls'],entry['numLevel'])
+                # summary keeps every time
+                LevelStats(stats).add(entry['seconds'])
+                # every time kept unless trimming is asked for
+                records.append(entry['seconds'])
+                if config.maxLevelRecords is not None:
+                    del records[:-config.maxLevelRecords]
+        else:
+            assert False, 'journal entry not recognized'
+            
+    def record(self,entry):
+        # apply now, journal on next flush
+        self.load()
+        self.seq += 1
+        entry['seq'] = self.seq
+        self.apply(entry)
+        self.pending.append(entry)
+        
+    def get(self,key):
+        return(self.load()[key])
+        
+    def levelSlots(self,easyControls,numLevel):
+        '''records and stats values of a training level.
+        The lists grow when the pack holds more levels than the data.'''
+        mode = 'easy' if easyControls else 'hard'
+        data = self.load()
+        records = data[mode + 'LevelRecords']
+        stats = data[mode + 'LevelStats']
+        # empty slots are not journaled, replaying the journal adds them again
+        while len(records) < numLevel:
+            records.append([])
+        while len(stats) < numLevel:
+            stats.append(LevelStats().values)
+        return((records[numLevel-1], stats[numLevel-1]))
+        
+    def levelStats(self,easyControls,numLevel):
+        '''summary of the times on a training level'''
+        return(LevelStats(self.levelSlots(easyControls,numLevel)[1]))
+        
+    def set(self,key,value):
+        # only a real change needs saving
+        if self.load().get(key) != value:
+            self.record({'op': 'set', 'key': key, 'value': value})
+            
+    def increment(self,key,amount=1):
+        self.record({'op': 'increment', 'key': key, 'amount': amount})
+        
+    def recordAttempt(self,gameType,numLevel,easyControls,outcome,seconds,seed=None):
+        '''stores the outcome of one flight and its time'''
+        self.record({'op': 'attempt', 'gameType': gameType, 'numLevel': numLevel,
+                     'easyControls': easyControls, 'outcome': outcome,
+                     'seconds': seconds, 'seed': seed})
+        
+    def markDirty(self):
+        # data changed directly, needs a full snapshot
+        self.dirty = True
+        
+    def flush(self,block=False):
+        '''hands changes since the last flush to the writer.
+        With a full queue they are kept for the next flush unless block.'''
+        # a failed write is covered by a full snapshot
+        if self.writer.error is not None:
+            self.writer.error = None
+            self.markDirty()
+        # append new entries
+        if self.pending and self.writer.submit(('append', self.pending), block):
+            self.journalLength += len(self.pending)
+            self.pending = []
+        # fold long journal into snapshot
+        if self.dirty or self.journalLength >= config.journalCompactSize:
+            self.compact(block)
+            
+    def compact(self,block=False):
+        '''writes a full snapshot and empties the journal'''
+        if self.data is None:
+            return
+        # snapshot first, covering every entry so far
+        self.data['journalSeq'] = self.seq
+        # attempts never appended only reach the database with the snapshot
+        attempts = [entry for entry in self.pending if entry['op'] == 'attempt']
+        # text made now, data keeps changing while the writer works
+        if self.writer.submit(('snapshot', json.dumps(self.data), attempts), block):
+            # entries not yet written are in the snapshot too
+            self.pending = []
+            # writer then empties journal, a crash in between only leaves old entries
+            self.journalLength = 0
+            self.dirty = False
+            
+    def shutdown(self):
+        '''writes everything and stops the writer, call before quitting'''
+        self.flush(True)
+        self.writer.stop()
+        # last writes failed too, nothing is left to retry them
+        if self.writer.error is not None:
+            error = self.writer.error
+            self.writer.error = None
+            raise error
 
+# shared by the whole game
+store = DataStore()
+# nothing lost however the game exits
+atexit.register(store.shutdown)
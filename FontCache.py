@@ -0,0 +1,59 @@
+#!/usr/bin/python
+
+#------------------------------------------------------------
+# IMPORTS
+#------------------------------------------------------------
+
+# External modules
+import pygame
+from collections import OrderedDict
+
+# Internal modules
+import config
+
+#------------------------------------------------------------
+# Caches
+
+# font size -> pygame font, shared by game and menus
+fonts = {}
+# (text, size, colour) -> rendered surface, least recently used first
+renderedText = OrderedDict()
+
+#------------------------------------------------------------
+# Functions
+
+def getFont(fontSize):
+    '''opens the game font once per size'''
+    font = fonts.get(fontSize)
+    if font is None:
+        font = pygame.font.Font(config.fontFile, fontSize)
+        fonts[fontSize] = font
+    return(font)
+
+def renderText(text, fontSize, colour=config.WHITE):
+    '''renders text, reusing recent renders'''
+    key = (text, fontSize, colour)
+    # cached render
+    surface = renderedText.get(key)
+    if surface is not None:
+        renderedText.move_to_end(key)
+        return(surface)
+    # new render
+    surface = getFont(fontSize).render(text, True, colour)
+    renderedText[key] = surface
+    # drop least recently used
+    if len(renderedText) > config.textCacheSize:
+        renderedText.popitem(last=False)
+    return(surface)
+
+def fitFontSize(texts, fontSize, maxWidth):
+    '''shrinks fontSize by 1.2 until every text is narrower than maxWidth.
+    Uses font metrics so no candidate size is rendered.'''
+    # iterate until satisfied
+    while fontSize > 1:
+        font = getFont(fontSize)
+        # check fits
+        if all([font.size(text)[0] < maxWidth for text in texts]):
+            break
+        fontSize = int(fontSize / 1.2)
+    return(fontSize)
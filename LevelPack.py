@@ -0,0 +1,305 @@
+#!/usr/bin/python
+
+#------------------------------------------------------------
+# IMPORTS
+#------------------------------------------------------------
+
+# External modules
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+
+# Internal modules
+import config
+
+#------------------------------------------------------------
+# Parameters
+
+# pack layout, all little-endian:
+#   header  : magic, version, number of levels
+#   offsets : numLevels+1 unsigned ints, level i is bytes offsets[i-1] to offsets[i]
+#   levels  : fixed part, then post box and asteroid locations, then texts
+MAGIC = b'SPLV'
+VERSION = 1
+HEADER = struct.Struct('<4sHI')
+OFFSET = struct.Struct('<I')
+# xmax, ymax, ship, warp out, text location, numPostBox, numAsteroid, flags
+FIXED = struct.Struct('<8dHHB')
+LOCATION = struct.Struct('<2d')
+TEXTLENGTH = struct.Struct('<H')
+# flag for a level with different text for hard controls
+HARDTEXT = 1
+
+# raised for a damaged or unknown pack file
+class PackError(Exception):
+    pass
+
+#------------------------------------------------------------
+# COMPILING
+#------------------------------------------------------------
+
+def sourceFiles(levelType, folder=config.levelsFolder):
+    '''json sources of a level type, in level order'''
+    return(sorted(glob.glob(os.path.join(folder, levelType, '*.json'))))
+
+def packFile(levelType, folder=config.levelsFolder):
+    return(os.path.join(folder, levelType + '.pack'))
+
+def readSource(filename):
+    '''one level from its json source'''
+    with open(filename, 'r') as f:
+        return(json.load(f))
+
+def packText(text):
+    data = text.encode('utf-8')
+    return(TEXTLENGTH.pack(len(data)) + data)
+
+def packLevel(level):
+    '''bytes for one level of a pack'''
+    flags = HARDTEXT if 'hardText' in level else 0
+    textLocation = level.get('textLocation', (0.5,0.5))
+    parts = [FIXED.pack(level['xmax'], level['ymax'],
+                        level['postShip'][0], level['postShip'][1],
+                        level['warpOut'][0], level['warpOut'][1],
+                        textLocation[0], textLocation[1],
+                        len(level['postBoxes']), len(level['asteroids']), flags)]
+    # locations
+    for loc in level['postBoxes'] + level['asteroids']:
+        parts.append(LOCATION.pack(loc[0], loc[1]))
+    # instructions
+    parts.append(packText(level.get('text', '')))
+    if flags & HARDTEXT:
+        parts.append(packText(level['hardText']))
+    return(b''.join(parts))
+
+def writePack(filename, records):
+    '''writes packed levels with their header and offset table'''
+    numLevels = len(records)
+    # levels start after the header and offset table
+    offsets = [HEADER.size + OFFSET.size*(numLevels+1)]
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+    parts = [HEADER.pack(MAGIC, VERSION, numLevels)] + [OFFSET.pack(offset) for offset in offsets] + records
+    # write then replace so readers never see half a file
+    tmpFilename = filename + '.tmp'
+    with open(tmpFilename, 'wb') as f:
+        f.write(b''.join(parts))
+    os.replace(tmpFilename, filename)
+
+def compilePack(levelType, folder=config.levelsFolder):
+    '''compiles the json sources of a level type into its pack.
+    Returns the number of levels packed.'''
+    records = [packLevel(readSource(filename)) for filename in sourceFiles(levelType, folder)]
+    replacePack(levelType, records, folder)
+    return(len(records))
+
+def replacePack(levelType, records, folder=config.levelsFolder):
+    '''writes a pack, an open copy is swapped for the new file in the same step'''
+    with packsLock:
+        # an open map would block replacing the file on some systems
+        wasOpen = levelType in packs
+        closePack(levelType)
+        filename = packFile(levelType, folder)
+        writePack(filename, records)
+        if wasOpen:
+            packs[levelType] = LevelPack(filename)
+
+#------------------------------------------------------------
+# LEVEL PACK
+#------------------------------------------------------------
+
+#------------------------------------------------------------
+# Level pack
+class LevelPack:
+    """Read only view of a compiled level pack.
+    The file is memory mapped and only the offset table is read on
+    opening, so fetching level N costs the same for any pack size."""
+    def __init__(self,filename):
+        # store parameters
+        self.filename = filename
+        # map file
+        with open(filename, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # check header
+        if len(self.data) < HEADER.size:
+            raise PackError('level pack %s is too short' % filename)
+        magic, version, self.numLevels = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise PackError('level pack %s has an unknown format' % filename)
+        if len(self.data) < HEADER.size + OFFSET.size*(self.numLevels+1):
+            raise PackError('level pack %s is truncated' % filename)
+
+    def __len__(self):
+        return(self.numLevels)
+
+    def close(self):
+        # callers hold packsLock, readers in LevelsLoader take it too
+        self.data.close()
+
+    def span(self,levelNumber):
+        '''start and end bytes of level levelNumber, counted from 1'''
+        assert 1 <= levelNumber and levelNumber <= self.numLevels, 'requested level is not in pack'
+        position = HEADER.size + OFFSET.size*(levelNumber-1)
+        return(struct.unpack_from('<2I', self.data, position))
+
+    def readText(self,position):
+        # text and the position after it
+        length, = TEXTLENGTH.unpack_from(self.data, position)
+        position += TEXTLENGTH.size
+        return(self.data[position:position+length].decode('utf-8'), position+length)
+
+    def level(self,levelNumber,easyControls=True):
+        '''level tuple as made by LevelsLoader.getLevel'''
+        start, end = self.span(levelNumber)
+        if end > len(self.data):
+            raise PackError('level pack %s is truncated' % self.filename)
+        # fixed part
+        values = FIXED.unpack_from(self.data, start)
+        xmax,ymax,shipx,shipy,warpx,warpy,textx,texty,numPostBox,numAsteroid,flags = values
+        position = start + FIXED.size
+        # locations
+        numLocations = numPostBox + numAsteroid
+        coords = struct.unpack_from('<%dd' % (2*numLocations), self.data, position)
+        locations = [(coords[2*i], coords[2*i+1]) for i in range(numLocations)]
+        position += LOCATION.size*numLocations
+        # instructions
+        text, position = self.readText(position)
+        if flags & HARDTEXT:
+            hardText, position = self.readText(position)
+            if not easyControls:
+                text = hardText
+        return((xmax,ymax,(shipx,shipy),(warpx,warpy),locations[:numPostBox],locations[numPostBox:],text,(textx,texty)))
+
+#------------------------------------------------------------
+# Open packs
+
+# level type -> open pack
+packs = {}
+packsLock = threading.RLock()
+
+def isStale(levelType, folder=config.levelsFolder):
+    '''True if the pack is missing or older than its sources'''
+    filename = packFile(levelType, folder)
+    if not os.path.exists(filename):
+        return(True)
+    packTime = os.path.getmtime(filename)
+    # the folder changes when a source is added or removed
+    sources = [os.path.join(folder, levelType)] + sourceFiles(levelType, folder)
+    return(any([os.path.getmtime(source) > packTime for source in sources]))
+
+def getPack(levelType, folder=config.levelsFolder):
+    '''open pack for a level type, None if there are no such levels.
+    A missing or out of date pack is compiled from its sources
+    once per session, lookups never check the sources.'''
+    with packsLock:
+        if levelType not in packs:
+            filename = packFile(levelType, folder)
+            if sourceFiles(levelType, folder):
+                if isStale(levelType, folder):
+                    compilePack(levelType, folder)
+            elif not os.path.exists(filename):
+                return(None)
+            packs[levelType] = LevelPack(filename)
+        return(packs[levelType])
+
+def closePack(levelType):
+    # next getPack opens the file again
+    with packsLock:
+        pack = packs.pop(levelType, None)
+        if pack is not None:
+            pack.close()
+
+#------------------------------------------------------------
+# LEVEL WATCHER
+#------------------------------------------------------------
+
+#------------------------------------------------------------
+# Level watcher
+class LevelWatcher:
+    """Keeps a level pack in step with its sources while levels are edited.
+    poll() compares source modification times, parses only the files
+    that changed and writes the pack again from the packed bytes it
+    already holds for every other level."""
+    def __init__(self,levelType,folder=config.levelsFolder):
+        # store parameters
+        self.levelType = levelType
+        self.folder = folder
+        # source file -> modification time when parsed
+        self.mtimes = {}
+        # source file -> packed level
+        self.records = {}
+        # source files in the pack, in level order
+        self.order = []
+        # source file -> why its latest version could not be loaded
+        self.errors = {}
+        # parse every source and write a matching pack
+        self.poll(True)
+
+    def parse(self,filename):
+        # packed level, None while the source is unreadable
+        try:
+            record = packLevel(readSource(filename))
+        except (IOError, OSError, ValueError, KeyError, IndexError, TypeError, struct.error) as error:
+            # half saved or mistyped, keep the old version until fixed
+            self.errors[filename] = str(error)
+            return(None)
+        self.errors.pop(filename, None)
+        return(record)
+
+    def poll(self,rewrite=False):
+        '''re-parses changed sources and patches the pack.
+        Returns the numbers of the levels that changed.'''
+        changed = set()
+        files = sourceFiles(self.levelType, self.folder)
+        # parse changed sources only
+        for filename in files:
+            try:
+                mtime = os.path.getmtime(filename)
+            except OSError:
+                # removed since listed
+                continue
+            if self.mtimes.get(filename) != mtime:
+                # unreadable versions are not tried again until saved again
+                self.mtimes[filename] = mtime
+                record = self.parse(filename)
+                if record is not None:
+                    changed.add(filename)
+                    if record == self.records.get(filename):
+                        # saved without changes
+                        changed.discard(filename)
+                    self.records[filename] = record
+        # forget removed sources
+        for filename in list(self.records):
+            if filename not in files:
+                del self.records[filename]
+        for filename in list(self.mtimes):
+            if filename not in files:
+                del self.mtimes[filename]
+                self.errors.pop(filename, None)
+        # levels from an added or removed source onwards are renumbered
+        order = [filename for filename in files if filename in self.records]
+        numbers = set([order.index(filename)+1 for filename in changed])
+        for i in range(max(len(order), len(self.order))):
+            if i >= len(order) or i >= len(self.order) or order[i] != self.order[i]:
+                numbers.update(range(i+1, max(len(order), len(self.order))+1))
+                break
+        self.order = order
+        # write pack from held bytes, no pack made for a type without sources
+        if numbers or (rewrite and self.order):
+            replacePack(self.levelType, [self.records[filename] for filename in self.order], self.folder)
+        return(numbers)
+
+    def problems(self):
+        '''messages for sources that could not be loaded, in level order'''
+        return(['%s: %s' % (os.path.basename(filename), self.errors[filename]) for filename in sorted(self.errors)])
+
+#------------------------------------------------------------
+# run
+if __name__ == '__main__':
+    # compile every level folder
+    for folder in sorted(glob.glob(os.path.join(config.levelsFolder, '*', ''))):
+        levelType = os.path.basename(os.path.dirname(folder))
+        print('packed %d %s levels into %s' % (compilePack(levelType), levelType, packFile(levelType)))
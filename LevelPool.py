@@ -0,0 +1,270 @@
+#!/usr/bin/python
+
+#------------------------------------------------------------
+# IMPORTS
+#------------------------------------------------------------
+
+# External modules
+import glob
+import json
+import multiprocessing
+import os
+import threading
+
+# Internal modules
+import config
+import LevelsLoader
+from RandomStreams import newSeed
+
+#------------------------------------------------------------
+# SOLVABILITY
+#------------------------------------------------------------
+
+def segmentDistance(start, end, point):
+    '''shortest distance from point to the segment start-end'''
+    # segment direction
+    seg_x = end[0] - start[0]
+    seg_y = end[1] - start[1]
+    lengthSq = seg_x**2 + seg_y**2
+    # project point onto segment
+    if lengthSq == 0:
+        t = 0.0
+    else:
+        t = ((point[0] - start[0])*seg_x + (point[1] - start[1])*seg_y) / lengthSq
+        t = max(0.0, min(1.0, t))
+    # closest point on segment
+    near_x = start[0] + t*seg_x
+    near_y = start[1] + t*seg_y
+    return(((point[0] - near_x)**2 + (point[1] - near_y)**2)**0.5)
+
+def isSolvable(level):
+    '''conservative check that a level can be flown.
+    With easy controls the ship can stop and turn anywhere, so a level
+    is solvable if a path of short straight flights clear of every hazard
+    joins the ship to each delivery zone and then to the warp out.
+    Flights are searched on a grid of waypoints over the board.'''
+    # unpack level
+    xmax,ymax,postShip_loc,warpOut_loc,postBox_locs,asteroid_locs,text,text_loc = level
+    # hazards with the clearance the ship centre needs
+    hazards = [(loc, config.asteroidSize/2.0 + config.postShipSize/2.0 + config.solverMargin) for loc in asteroid_locs]
+    if config.precisionDelivery:
+        hazards += [(loc, config.postBoxInnerSize/2.0 + config.postShipSize/2.0 + config.solverMargin) for loc in postBox_locs]
+    # warp out ends the flight, only the last hop may touch it
+    warpOutClear = config.warpOutInnerSize/2.0 + config.postShipSize/2.0 + config.solverMargin
+    def clearFlight(start, end, toWarpOut=False):
+        for loc, clearance in hazards:
+            if segmentDistance(start, end, loc) < clearance:
+                return(False)
+        if not toWarpOut and segmentDistance(start, end, warpOut_loc) < warpOutClear:
+            return(False)
+        return(True)
+    # waypoint grid
+    step = config.solverGridStep
+    numCols = int(xmax/step) + 1
+    numRows = int(ymax/step) + 1
+    # search from the ship to neighbouring waypoints
+    reached = set()
+    toVisit = []
+    for i in range(numCols):
+        for j in range(numRows):
+            if abs(i*step - postShip_loc[0]) <= step and abs(j*step - postShip_loc[1]) <= step:
+                if clearFlight(postShip_loc, (i*step, j*step)):
+                    reached.add((i,j))
+                    toVisit.append((i,j))
+    while toVisit:
+        i, j = toVisit.pop()
+        for (ni, nj) in [(i+1,j),(i-1,j),(i,j+1),(i,j-1),(i+1,j+1),(i-1,j-1),(i+1,j-1),(i-1,j+1)]:
+            if 0 <= ni < numCols and 0 <= nj < numRows and (ni,nj) not in reached:
+                if clearFlight((i*step, j*step), (ni*step, nj*step)):
+                    reached.add((ni,nj))
+                    toVisit.append((ni,nj))
+    # reachable points, the ship start included
+    points = [postShip_loc] + [(i*step, j*step) for (i,j) in reached]
+    # every delivery zone entered
+    deliveryLimit = (config.postBoxOuterSize/2.0)**2
+    for loc in postBox_locs:
+        if not any([(x - loc[0])**2 + (y - loc[1])**2 < deliveryLimit for (x,y) in points]):
+            return(False)
+    # warp out reached with a last short hop
+    hopLimit = (warpOutClear + 2*step)**2
+    for (x,y) in points:
+        if (x - warpOut_loc[0])**2 + (y - warpOut_loc[1])**2 <= hopLimit:
+            if clearFlight((x,y), warpOut_loc, True):
+                return(True)
+    return(False)
+
+def makeLevel(params):
+    '''finds a seed whose random level passes the solvability check.
+    Runs inside the worker processes, so it must stay picklable.'''
+    xmax,ymax,numPostBox,numAsteroid = params
+    # bounded number of tries
+    for attempt in range(config.levelPoolTries):
+        seed = newSeed()
+        level = LevelsLoader.getLevel('random',xmax=xmax,ymax=ymax,numPostBox=numPostBox,numAsteroid=numAsteroid,seed=seed)
+        if isSolvable(level):
+            return((seed,level))
+    # give up
+    return(None)
+
+#------------------------------------------------------------
+# LEVEL POOL
+#------------------------------------------------------------
+
+#------------------------------------------------------------
+# Level pool
+class LevelPool:
+    """Disk-backed queue of validated random levels.
+    Levels are made in a multiprocessing pool and stored one file
+    per level, so the queue survives between sessions. Once started
+    the pool serves LevelsLoader.getLevel('random') and is topped up
+    in the background after every level taken."""
+    def __init__(self,
+                 folder = config.levelPoolFolder,
+                 size = config.levelPoolSize,
+                 xmax = config.xmax,
+                 ymax = config.ymax,
+                 numPostBox = config.numPostBox,
+                 numAsteroid = config.numAsteroid):
+        # store parameters
+        self.folder = folder
+        self.size = size
+        self.params = (xmax,ymax,numPostBox,numAsteroid)
+        # levels handed out and waiting for getLevel
+        self.served = {}
+        # background workers
+        self.workers = None
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        # folder for level files
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+        # serve getLevel
+        LevelsLoader.levelPool = self
+        # fill in background, fresh processes so workers do not inherit the display threads
+        self.workers = multiprocessing.get_context('spawn').Pool(config.levelPoolWorkers)
+        self.topUp()
+
+    def shutdown(self):
+        # stop serving
+        if LevelsLoader.levelPool is self:
+            LevelsLoader.levelPool = None
+        # half made levels are not needed
+        if self.workers is not None:
+            self.workers.terminate()
+            self.workers.join()
+            self.workers = None
+
+    def matches(self,xmax,ymax,numPostBox,numAsteroid):
+        # pool only holds levels of one shape
+        return((xmax,ymax,numPostBox,numAsteroid) == self.params)
+
+    def filePattern(self):
+        # file name prefix for this level shape
+        return(os.path.join(self.folder, '%dx%d_%d_%d_*.json' % self.params))
+
+    def fileName(self,seed):
+        # file name for one level
+        return(self.filePattern().replace('*', str(seed)))
+
+    def lastName(self):
+        # last level handed out, outside the file pattern so it is not served twice
+        return(os.path.join(self.folder, '%dx%d_%d_%d.last' % self.params))
+
+    def entries(self):
+        # stored level files, oldest first
+        files = glob.glob(self.filePattern())
+        files.sort(key=os.path.getmtime)
+        return(files)
+
+    def take(self):
+        '''hands out the seed of a validated level'''
+        result = None
+        # oldest stored level
+        for filename in self.entries():
+            try:
+                with open(filename, 'r') as f:
+                    result = self.unpack(json.load(f))
+                # kept as the last checked level
+                os.replace(filename, self.lastName())
+                break
+            except (IOError, OSError, ValueError):
+                # unreadable or already taken, try the next one
+                result = None
+        # empty pool, make one here
+        if result is None:
+            result = makeLevel(self.params)
+            if result is not None:
+                try:
+                    self.write(self.lastName(),result)
+                except (IOError, OSError):
+                    # only the fallback misses out
+                    pass
+        # refill in background
+        self.topUp()
+        # nothing valid found, serve the last level that passed the check again
+        if result is None:
+            try:
+                with open(self.lastName(), 'r') as f:
+                    result = self.unpack(json.load(f))
+            except (IOError, OSError, ValueError):
+                result = None
+        # no level of this shape has ever passed, its own seed still remakes it
+        if result is None:
+            seed = newSeed()
+            result = (seed, LevelsLoader.getLevel('random',xmax=self.params[0],ymax=self.params[1],numPostBox=self.params[2],numAsteroid=self.params[3],seed=seed))
+        # keep level until getLevel asks for it
+        seed, level = result
+        self.served[seed] = level
+        return(seed)
+
+    def claim(self,seed):
+        '''returns the stored level for seed, or None if not pooled'''
+        return(self.served.pop(seed, None))
+
+    def topUp(self):
+        # nothing to do without workers
+        if self.workers is None:
+            return
+        with self.lock:
+            # levels still needed
+            numMissing = self.size - len(self.entries()) - self.pending
+            self.pending += max(numMissing, 0)
+        # queue work
+        for i in range(numMissing):
+            self.workers.apply_async(makeLevel, (self.params,), callback=self.store, error_callback=self.failed)
+
+    def failed(self,error):
+        # worker raised, the next top up asks again
+        with self.lock:
+            self.pending -= 1
+
+    def store(self,result):
+        # runs on the result thread of the multiprocessing pool
+        with self.lock:
+            self.pending -= 1
+        if result is None:
+            return
+        # an exception here would stop the result thread, so bad results are dropped
+        try:
+            self.write(self.fileName(result[0]),result)
+        except Exception:
+            pass
+
+    def write(self,filename,result):
+        # write then rename so readers never see half a file
+        seed, level = result
+        tmpFilename = filename + '.tmp'
+        with open(tmpFilename, 'w') as f:
+            json.dump({'seed': seed, 'level': level}, f)
+        os.replace(tmpFilename, filename)
+
+    def unpack(self,entry):
+        # json turns tuples into lists
+        xmax,ymax,postShip_loc,warpOut_loc,postBox_locs,asteroid_locs,text,text_loc = entry['level']
+        level = (xmax,ymax,tuple(postShip_loc),tuple(warpOut_loc),
+                 [tuple(loc) for loc in postBox_locs],
+                 [tuple(loc) for loc in asteroid_locs],
+                 text,tuple(text_loc))
+        return((entry['seed'],level))
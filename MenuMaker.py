@@ -7,8 +7,10 @@
 # External modules
 import pygame
 from pygame.locals import KMOD_ALT, K_F4, QUIT, KEYDOWN, KEYUP, Rect
-from random import randint
+import random
 import config
+import FontCache
+import AssetManager
 
 #------------------------------------------------------------
 # VIEW
@@ -18,59 +20,91 @@ import config
 # Menu drawer
 class MenuDrawer:
     """Draws the menu"""
-    def __init__(self,messageText1,messageText2,backgroundFilename,buttons):
+    def __init__(self,messageText1,messageText2,background,buttons,rng=random):
         # store parameters
         self.buttons = [button.makeDrawer() for button in buttons]
+        self.rng = rng
         # prepare images
-        self.displayBackground = self.prepareBackground(backgroundFilename)
+        self.displayBackground = self.prepareBackground(background)
         # prepare text
         self.text1, self.text1Rect, self.text2, self.text2Rect = self.scaleText(messageText1,messageText2)
+        # background, text and resting buttons drawn together once
+        self.composed = None
+        self.composedWin = None
+        # button states on screen
+        self.buttonStates = ['normal'] * len(self.buttons)
+        
+    def compose(self,win=False):
+        # only rebuilt if the button colour changes
+        if self.composed is None or self.composedWin != win:
+            self.composed = pygame.Surface((screenWidth,screenHeight)).convert()
+            self.draw(self.composed)
+            for button in self.buttons:
+                button.draw(win,'normal',self.composed)
+            self.composedWin = win
+        return(self.composed)
         
     def redraw(self,win=False):
-        # draw yourself
-        self.draw()
-        # draw your buttons
-        for button in self.buttons:
-            button.draw(win)
+        # draw yourself and your buttons
+        screen.blit(self.compose(win),(0,0))
+        # buttons not at rest
+        for i in range(len(self.buttons)):
+            if self.buttonStates[i] != 'normal':
+                self.buttons[i].draw(win,self.buttonStates[i])
         # update the screen
         pygame.display.flip()
         
-    def prepareBackground(self,backgroundFilename):
-        # load background
-        background = pygame.image.load(backgroundFilename)
+    def updateButtons(self,win,states):
+        '''redraws only the buttons whose state changed'''
+        composed = self.compose(win)
+        changedRects = []
+        for i in range(len(self.buttons)):
+            if states[i] != self.buttonStates[i]:
+                # restore resting button then draw new state
+                rect = self.buttons[i].getRect()
+                screen.blit(composed, rect, rect)
+                self.buttons[i].draw(win,states[i])
+                changedRects.append(rect)
+        self.buttonStates = list(states)
+        # update changed areas of the screen
+        if changedRects:
+            pygame.display.update(changedRects)
+        
+    def prepareBackground(self,backgroundImage):
+        # surface handed over in memory
+        if isinstance(backgroundImage, pygame.Surface):
+            background = backgroundImage
+        # or load from file
+        else:
+            background = AssetManager.loadImage(backgroundImage)
         # size of background
         backgroundWidth  = background.get_width()
         backgroundHeight = background.get_height()
         # scale up if necessary
         rescaleRatio = max( screenWidth / backgroundWidth, screenHeight / backgroundHeight, 1)
-        tmpBackground = pygame.transform.scale(background, (int(0.4+backgroundWidth*rescaleRatio),int(0.4+backgroundHeight*rescaleRatio)))
+        newSize = (int(0.4+backgroundWidth*rescaleRatio),int(0.4+backgroundHeight*rescaleRatio))
+        if newSize == background.get_size():
+            tmpBackground = background
+        elif isinstance(backgroundImage, pygame.Surface):
+            tmpBackground = pygame.transform.scale(background, newSize)
+        else:
+            tmpBackground = AssetManager.getImage(backgroundImage, newSize)
         # random start point
         tmp_width = tmpBackground.get_width()
         tmp_height = tmpBackground.get_height()
-        x_start = randint(0,tmp_width  - screenWidth)
-        y_start = randint(0,tmp_height - screenHeight)
+        x_start = self.rng.randint(0,tmp_width  - screenWidth)
+        y_start = self.rng.randint(0,tmp_height - screenHeight)
         # clip out
         subimage = tmpBackground.subsurface(x_start,y_start,screenWidth,screenHeight)
         # save
         return(subimage)
     
     def scaleText(self,messageText1,messageText2):
-        # initial font size
-        fontSize = config.menuFontSize
-        # iterate until satisfied
-        while True:
-            # title text
-            font = pygame.font.Font('FreeSansBold.ttf', fontSize)
-            text1 = font.render(messageText1, True, config.WHITE)
-            text2 = font.render(messageText2, True, config.WHITE)
-            # get widths
-            text1Width = text1.get_width()
-            text2Width = text2.get_width()
-            # check fits
-            if (text1Width < screenWidth) and (text2Width < screenWidth):
-                break
-            else:
-                fontSize = int(fontSize / 1.2)
+        # largest font size that fits
+        fontSize = FontCache.fitFontSize([messageText1,messageText2], config.menuFontSize, screenWidth)
+        # title text
+        text1 = FontCache.renderText(messageText1, fontSize)
+        text2 = FontCache.renderText(messageText2, fontSize)
         # rectangles containing text
         text1Rect = text1.get_rect()
         text2Rect = text2.get_rect()
@@ -83,12 +117,15 @@ class MenuDrawer:
         # store
         return(text1, text1Rect, text2, text2Rect)
         
-    def draw(self):
+    def draw(self,target=None):
+        # draw on screen unless told otherwise
+        if target is None:
+            target = screen
         # draw background
-        screen.blit(self.displayBackground,(0,0))
+        target.blit(self.displayBackground,(0,0))
         # draw text
-        screen.blit(self.text1, self.text1Rect)
-        screen.blit(self.text2, self.text2Rect)
+        target.blit(self.text1, self.text1Rect)
+        target.blit(self.text2, self.text2Rect)
 
 #------------------------------------------------------------
 # Menu button drawer
@@ -102,26 +139,38 @@ class MenuButtonDrawer:
         
     def scaleText(self,text):
         # button text
-        font = pygame.font.Font('FreeSansBold.ttf', config.buttonFontSize)
-        text = font.render(text, True, config.WHITE)
+        text = FontCache.renderText(text, config.buttonFontSize)
         textRect = text.get_rect()
         textRect.center = self.buttonRect.center
         # store
         return(text, textRect)
         
-    def draw(self,win=False):
+    def getRect(self):
+        # screen area of button in any state
+        return(self.buttonRect.inflate(8,8))
+        
+    def draw(self,win=False,state='normal',target=None):
+        # draw on screen unless told otherwise
+        if target is None:
+            target = screen
         # button color
         if win:
             buttonCol = config.GREEN
         else:
             buttonCol = config.RED
-        # bounding rectangle + 4 size
-        buttonBacking = self.buttonRect.inflate(4,4)
-        pygame.draw.rect(screen, buttonCol, buttonBacking)
-        # button proper
-        pygame.draw.rect(screen, config.BLACK, self.buttonRect)
+        # bounding rectangle + 4 size, + 8 under the mouse
+        if state == 'normal':
+            buttonBacking = self.buttonRect.inflate(4,4)
+        else:
+            buttonBacking = self.buttonRect.inflate(8,8)
+        pygame.draw.rect(target, buttonCol, buttonBacking)
+        # button proper, lit while held down
+        if state == 'pressed':
+            pygame.draw.rect(target, config.DARKGREY, self.buttonRect)
+        else:
+            pygame.draw.rect(target, config.BLACK, self.buttonRect)
         # draw text
-        screen.blit(self.text, self.textRect)
+        target.blit(self.text, self.textRect)
 
 
 #------------------------------------------------------------
@@ -137,14 +186,19 @@ class MenuInstance:
     - message text 1
     - message text 2
     - button list
-    - background image"""
-    def __init__(self,screen,messageText1,messageText2,buttonList,backgroundImage):
+    - background image, as a surface or file name
+    Optional input:
+    - random generator for the background crop
+    - hotkeys, dict of key to button text"""
+    def __init__(self,screen,messageText1,messageText2,buttonList,backgroundImage,rng=random,hotkeys=None):
+        # store parameters
+        self.hotkeys = hotkeys if hotkeys is not None else {}
         # globalize screen
         self.globalize(screen)
         # make buttons
         self.buttons = self.makeButtons(buttonList)
         # make drawer
-        self.view = MenuDrawer(messageText1,messageText2,backgroundImage,self.buttons)
+        self.view = MenuDrawer(messageText1,messageText2,backgroundImage,self.buttons,rng)
         
     def globalize(self,screenToGlobal):
         # make screen global
@@ -157,6 +211,24 @@ class MenuInstance:
         screenHeight = screen.get_height()
         screenRect = screen.get_rect()
         
+    def buttonAt(self,mouse_xy):
+        # index of button under the mouse, None if none
+        for i in range(len(self.buttons)):
+            if self.buttons[i].rectangle.collidepoint(mouse_xy):
+                return(i)
+        return(None)
+        
+    def buttonStates(self,pressed):
+        # normal, hover, or pressed while held down over the button
+        hovered = self.buttonAt(pygame.mouse.get_pos())
+        states = ['normal'] * len(self.buttons)
+        if hovered is not None:
+            if hovered == pressed:
+                states[hovered] = 'pressed'
+            else:
+                states[hovered] = 'hover'
+        return(states)
+        
     def makeButtons(self,buttonList):
         # number of buttons
         numButtons = len(buttonList)
@@ -183,17 +255,27 @@ class MenuInstance:
         # return list of button objects
         return(buttonObjs)
         
-    def run(self,win=False):
+    def run(self,win=False,idle=None):
+        """Returns the text of the button picked, or 'quit'.
+        idle() is called while no input waits, until it returns False."""
         # preparation
-        fpsClock = pygame.time.Clock()
         mouse_dwn_xy = (0,0)
+        pressed = None
+        # draw whole menu once
+        self.view.redraw(win)
         # keep looping through
         status = 'running'
         while status == 'running':
-            # redraw screen
-            self.view.redraw(win)
+            # spare time goes to the idle work, one piece per pass
+            if idle is not None and not pygame.event.peek():
+                if not idle():
+                    idle = None
+                events = pygame.event.get()
+            # sleep until something happens, then take everything queued
+            else:
+                events = [pygame.event.wait(config.menuWaitTime)] + pygame.event.get()
             # loop through user events
-            for event in pygame.event.get():
+            for event in events:
                 # check if the event is the X button
                 if event.type == pygame.QUIT:
                     # quit the game
@@ -202,23 +284,30 @@ class MenuInstance:
                 if event.type == KEYDOWN and (event.key == K_F4 and bool(event.mod & KMOD_ALT)):
                     # quit the game
                     status = 'quit'
+                # check if a hotkey was pressed
+                elif event.type == KEYDOWN and event.key in self.hotkeys:
+                    # same as clicking its button
+                    status = self.hotkeys[event.key]
                 # check if mouse clicked
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     # store coordinates
                     mouse_dwn_xy = pygame.mouse.get_pos()
+                    pressed = self.buttonAt(mouse_dwn_xy)
                 if event.type == pygame.MOUSEBUTTONUP:
                     # store coordinates
                     mouse_up_xy = pygame.mouse.get_pos()
+                    pressed = None
                     # run clicked button
                     for button in self.buttons:
                         # if button clicked
                         if button.clickCheck(mouse_dwn_xy,mouse_up_xy):
-                            status = button.text            
-            # Lock FPS (upper bound)
-            fpsClock.tick(config.FPS)
-            ## find FPS (requires break post to read)
-            #fpsClock.tick()
-            #this_FPS = fpsClock.get_fps()
+                            status = button.text
+                # window uncovered
+                if event.type == pygame.VIDEOEXPOSE:
+                    self.view.redraw(win)
+            # show hover and pressed buttons
+            if status == 'running':
+                self.view.updateButtons(win,self.buttonStates(pressed))
         # no longer running
         return(status)
 
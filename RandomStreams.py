@@ -0,0 +1,33 @@
+#!/usr/bin/python
+
+#------------------------------------------------------------
+# IMPORTS
+#------------------------------------------------------------
+
+# External modules
+import random
+
+#------------------------------------------------------------
+# Functions
+
+def newSeed():
+    '''draws a fresh seed for a level'''
+    return(random.SystemRandom().randint(0,2**31-1))
+
+#------------------------------------------------------------
+# Random streams
+class RandomStreams:
+    """Independent random generators derived from one seed.
+    layout places the level objects, cosmetic picks textures,
+    rotations and background crops. Drawing more cosmetic numbers
+    never shifts the layout, so a seed always gives the same level."""
+    def __init__(self,seed):
+        # store parameters
+        self.seed = seed
+        # named streams
+        self.layout = self.stream('layout')
+        self.cosmetic = self.stream('cosmetic')
+
+    def stream(self,name):
+        # string seeds are hashed the same way on every run
+        return(random.Random('%d:%s' % (self.seed,name)))
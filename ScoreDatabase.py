@@ -0,0 +1,204 @@
+#!/usr/bin/python
+
+#------------------------------------------------------------
+# IMPORTS
+#------------------------------------------------------------
+
+# External modules
+from contextlib import contextmanager
+import sqlite3
+
+# Internal modules
+import config
+
+#------------------------------------------------------------
+# Parameters
+
+# raised for any database problem
+DatabaseError = sqlite3.Error
+
+# tables and indexes
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS profiles (
+    id       INTEGER PRIMARY KEY,
+    name     TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS modes (
+    id       INTEGER PRIMARY KEY,
+    name     TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS levels (
+    id       INTEGER PRIMARY KEY,
+    gameType TEXT NOT NULL,
+    numLevel INTEGER NOT NULL,
+    seed     INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (gameType, numLevel, seed)
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    id        INTEGER PRIMARY KEY,
+    profileId INTEGER NOT NULL REFERENCES profiles(id),
+    levelId   INTEGER NOT NULL REFERENCES levels(id),
+    modeId    INTEGER NOT NULL REFERENCES modes(id),
+    outcome   TEXT NOT NULL,
+    seconds   REAL,
+    seq       INTEGER,
+    UNIQUE (profileId, levelId, modeId, seq, outcome, seconds)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key      TEXT PRIMARY KEY,
+    value    TEXT
+);
+CREATE INDEX IF NOT EXISTS attemptsLeaderboard ON attempts (levelId, modeId, outcome, seconds);
+CREATE INDEX IF NOT EXISTS attemptsProfile ON attempts (profileId, levelId);
+'''
+
+#------------------------------------------------------------
+# SCORE DATABASE
+#------------------------------------------------------------
+
+#------------------------------------------------------------
+# Score database
+class ScoreDatabase:
+    """Local SQLite store of every flight.
+    Training levels are stored with seed 0, random levels by their
+    seed so a seeded level can have its own leaderboard.
+    A connection belongs to the thread that made it, so the
+    background writer and the game each open their own."""
+    def __init__(self,location=config.scoreDatabaseLocation):
+        # store parameters
+        self.location = location
+        # open and make tables
+        self.connection = sqlite3.connect(location)
+        # game can read while the writer writes
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+        # ids already looked up
+        self.ids = {}
+
+    def close(self):
+        self.connection.close()
+
+    def lookup(self,table,columns,values,add=True):
+        '''id of a row, added if missing unless add is False'''
+        key = (table,values)
+        if key not in self.ids:
+            # queries must not write, or they would lock out the writer
+            if add:
+                self.connection.execute('INSERT OR IGNORE INTO %s (%s) VALUES (%s)' % (table, ', '.join(columns), ', '.join(['?']*len(columns))), values)
+            where = ' AND '.join([column + ' = ?' for column in columns])
+            row = self.connection.execute('SELECT id FROM %s WHERE %s' % (table, where), values).fetchone()
+            if row is None:
+                return(None)
+            self.ids[key] = row[0]
+        return(self.ids[key])
+
+    def levelId(self,gameType,numLevel,seed,add=True):
+        # only random levels are told apart by seed
+        if gameType != 'random' or seed is None:
+            seed = 0
+        return(self.lookup('levels',('gameType','numLevel','seed'),(gameType,numLevel,seed),add))
+
+    def modeId(self,easyControls,add=True):
+        return(self.lookup('modes',('name',),('easy' if easyControls else 'hard',),add))
+
+    def profileId(self,profile,add=True):
+        return(self.lookup('profiles',('name',),(profile,),add))
+
+    def addAttempts(self,entries,profile=config.profileName):
+        '''stores journal attempt entries, entries already stored are skipped.
+        Journal numbers restart with a new data file, so an entry only
+        counts as stored if its level, mode, outcome and time match too.'''
+        # one transaction for the batch
+        with self.transaction():
+            self.insertAttempts(entries,profile)
+
+    @contextmanager
+    def transaction(self):
+        '''commits everything inside on success, nothing on error'''
+        try:
+            with self.connection:
+                yield
+        except DatabaseError:
+            # ids looked up in the rolled back transaction are gone again
+            self.ids = {}
+            raise
+
+    def insertAttempts(self,entries,profile):
+        # rows added in the caller's transaction
+        rows = []
+        for entry in entries:
+            rows.append((self.profileId(profile),
+                         self.levelId(entry['gameType'],entry['numLevel'],entry.get('seed')),
+                         self.modeId(entry['easyControls']),
+                         entry['outcome'],
+                         entry['seconds'],
+                         entry.get('seq')))
+        self.connection.executemany('INSERT OR IGNORE INTO attempts (profileId, levelId, modeId, outcome, seconds, seq) VALUES (?,?,?,?,?,?)', rows)
+
+    def leaderboard(self,gameType,numLevel,easyControls,seed=None,limit=10):
+        '''fastest completed times on one level as (profile, seconds)'''
+        query = '''SELECT profiles.name, attempts.seconds FROM attempts
+                   JOIN profiles ON profiles.id = attempts.profileId
+                   WHERE attempts.levelId = ? AND attempts.modeId = ? AND attempts.outcome = 'complete'
+                   ORDER BY attempts.seconds LIMIT ?'''
+        values = (self.levelId(gameType,numLevel,seed,False),self.modeId(easyControls,False),limit)
+        return(self.connection.execute(query,values).fetchall())
+
+    def bestTime(self,gameType,numLevel,easyControls,seed=None,profile=config.profileName):
+        '''personal best on one level, None if never completed'''
+        query = '''SELECT MIN(seconds) FROM attempts
+                   WHERE profileId = ? AND levelId = ? AND modeId = ? AND outcome = 'complete' '''
+        values = (self.profileId(profile,False),self.levelId(gameType,numLevel,seed,False),self.modeId(easyControls,False))
+        return(self.connection.execute(query,values).fetchone()[0])
+
+    def unsent(self,entries,profile):
+        # completed training times already stored, by level, mode and time
+        counts = {}
+        query = '''SELECT levels.numLevel, modes.name, attempts.seconds, COUNT(*) FROM attempts
+                   JOIN levels ON levels.id = attempts.levelId
+                   JOIN modes ON modes.id = attempts.modeId
+                   WHERE attempts.profileId = ? AND levels.gameType = 'training' AND attempts.outcome = 'complete'
+                   GROUP BY levels.numLevel, modes.name, attempts.seconds'''
+        for numLevel, mode, seconds, count in self.connection.execute(query,(self.profileId(profile,False),)):
+            counts[(numLevel,mode == 'easy',seconds)] = count
+        # each stored time accounts for one record
+        left = []
+        for entry in entries:
+            key = (entry['numLevel'],entry['easyControls'],entry['seconds'])
+            if counts.get(key,0) > 0:
+                counts[key] -= 1
+            else:
+                left.append(entry)
+        return(left)
+
+    def importJson(self,data,profile=config.profileName):
+        '''one-shot copy of the level records in a data.json dataset.
+        Times the game already sent to the database are left out.
+        Returns the number of records copied, 0 if already imported.'''
+        # only once per database
+        if self.connection.execute("SELECT value FROM meta WHERE key = 'importedJson'").fetchone():
+            return(0)
+        # records only hold completed training times
+        entries = []
+        for easyControls, key in [(True,'easyLevelRecords'),(False,'hardLevelRecords')]:
+            for i in range(len(data[key])):
+                for seconds in data[key][i]:
+                    entries.append({'gameType': 'training', 'numLevel': i+1, 'easyControls': easyControls,
+                                    'outcome': 'complete', 'seconds': seconds})
+        # records and import mark together, a crash leaves neither
+        with self.transaction():
+            # imported rows have no journal number, so stored ones must be skipped here
+            entries = self.unsent(entries,profile)
+            self.insertAttempts(entries,profile)
+            self.connection.execute("INSERT INTO meta (key, value) VALUES ('importedJson', ?)", (str(len(entries)),))
+        return(len(entries))
+
+#------------------------------------------------------------
+# run
+if __name__ == '__main__':
+    # copy existing records into the database
+    import DataHands
+    database = ScoreDatabase()
+    numRecords = database.importJson(DataHands.store.load())
+    print('imported %d records into %s' % (numRecords, database.location))
+    database.close()
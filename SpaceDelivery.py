@@ -6,238 +6,83 @@
 
 # External modules
 import pygame
-from pygame.locals import KMOD_ALT, K_F4, QUIT, KEYDOWN, KEYUP, Rect, K_w, K_a, K_s, K_d, K_UP, K_DOWN, K_LEFT, K_RIGHT, K_ESCAPE
-from math import floor,ceil,cos,sin,atan2,pi
-from random import random, randint
+from pygame.locals import KMOD_ALT, K_F4, QUIT, KEYDOWN, KEYUP, Rect, K_w, K_a, K_s, K_d, K_r, K_UP, K_DOWN, K_LEFT, K_RIGHT, K_ESCAPE
+from math import floor,ceil,cos,sin,pi
+import random
 
 # Internal modules
 import config
+import SpaceModel
+import FontCache
+import AssetManager
 from MenuMaker import MenuInstance
-from LevelsLoader import getLevel
+from LevelsLoader import getLevel, nextSeed, changedLevels, levelProblems, numLevels
+from RandomStreams import RandomStreams
 import DataHands
 
 #------------------------------------------------------------
 # MODEL
 #------------------------------------------------------------
+# The simulation itself lives in SpaceModel, these subclasses
+# only attach the matching drawer to each model object.
 
 #------------------------------------------------------------
 # Map Board
-class MapBoard:
-    """Size = [xmin xmax, ymin, ymax]"""
-    def __init__(self,xmax,ymax,text,text_loc,xmin=0.0,ymin=0.0):
-        # store parameters
-        self.xmin = xmin
-        self.xmax = xmax
-        self.ymin = ymin
-        self.ymax = ymax
-        self.text = text
-        self.text_loc = text_loc
-        
-    def makeDrawer(self):
-        return(MapBoardDrawer(self))
+class MapBoard(SpaceModel.MapBoard):
+    """Map board with a drawer."""
+    def makeDrawer(self,rng=random):
+        return(MapBoardDrawer(self,rng))
 
 #------------------------------------------------------------
 # Post Ship
-class PostShip:
-    """Post delivery ship.
-    Location is (x,y) tuple.
-    Board is map board ship belongs on."""
-    def __init__(self,
-                 location,
-                 board,
-                 velocity = (0,0),
-                 acceleration = (0,0),
-                 size = config.postShipSize):
-        # store parameters
-        self.x_loc, self.y_loc = location
-        self.x_vel, self.y_vel = velocity
-        self.x_acc, self.y_acc = acceleration
-        self.size = size
-        self.board = board
-        # engine indicators
-        if easyControls:
-            self.moveUp = False
-            self.moveDown = False
-            self.moveLeft = False
-            self.moveRight = False
-        else:
-            self.move = False
-            self.radians = 0.0
-        # indicator for waiting for level start
-        self.waiting = True
-        
-    def timeStep(self,dt):
-        # update acceleration
-        self.x_acc, self.y_acc = self.updateAcceleration()
-        # update velocity
-        self.x_vel += self.x_acc*dt
-        self.y_vel += self.y_acc*dt
-        # update location
-        self.x_loc += self.x_vel*dt
-        self.y_loc += self.y_vel*dt
-        
-    def updateAcceleration(self):
-        # EASY controls
-        if easyControls:
-            # vertical
-            if self.moveUp & (not self.moveDown):
-                y_acc = -config.accChange
-            elif self.moveDown & (not self.moveUp):
-                y_acc = +config.accChange
-            else:
-                y_acc = 0.0
-            # horizontal
-            if self.moveLeft & (not self.moveRight):
-                x_acc = -config.accChange
-            elif self.moveRight & (not self.moveLeft):
-                x_acc = +config.accChange
-            else:
-                x_acc = 0.0
-        # HARD controls
-        else:
-            # engine on
-            if self.move:
-                # vertical
-                y_acc = -cos(self.radians)*config.accChange
-                # horizontal
-                x_acc = -sin(self.radians)*config.accChange
-            # engine off
-            else:
-                x_acc = 0.0
-                y_acc = 0.0
-        # indicator for waiting for level start
-        if self.waiting and (x_acc != 0.0 or y_acc != 0.0):
-            self.waiting = False
-        # return
-        return((x_acc,y_acc))
-        
+class PostShip(SpaceModel.PostShip):
+    """Post ship with a drawer and mouse steering."""
     def computeRadians(self, mouse_pos):
         # mouse position
         mouse_x, mouse_y = mouse_pos
-        # ship location
-        ship_y = self.y_loc*modelToViewRatio + verti_offset
-        ship_x = self.x_loc*modelToViewRatio + horiz_offset
-        # calculate radians
-        change_y = ship_y - mouse_y
-        change_x = ship_x - mouse_x
-        self.radians = atan2(change_x,change_y)
-    
-    def lostInSpace(self):
-        # has post ship left the board?
-        if   self.x_loc > self.board.xmax + self.size/2.0:
-            return(True)
-        elif self.x_loc < self.board.xmin - self.size/2.0:
-            return(True)
-        elif self.y_loc > self.board.ymax + self.size/2.0:
-            return(True)
-        elif self.y_loc < self.board.ymin - self.size/2.0:
-            return(True)
-        else:
-            return(False)
+        # convert to model coordinates
+        target_x = (mouse_x - horiz_offset) / modelToViewRatio
+        target_y = (mouse_y - verti_offset) / modelToViewRatio
+        # steer towards mouse
+        self.pointAt((target_x,target_y))
         
-    def makeDrawer(self):
-        if easyControls:
+    def makeDrawer(self,rng=random):
+        if self.easyControls:
             return(PostShipEasyDrawer(self))
         else:
             return(PostShipHardDrawer(self))
 
 #------------------------------------------------------------
 # Post Box
-class PostBox:
-    """Location for post ship deliveries.
-    Location is (x,y) tuple.
-    Board is map board post box belongs on."""
-    def __init__(self,location, board, 
-                 innerSize = config.postBoxInnerSize, outerSize = config.postBoxOuterSize):
-        # store parameters
-        self.x_loc, self.y_loc = location
-        self.board = board
-        self.innerSize = innerSize
-        self.outerSize = outerSize
-        self.delivered = False
-        
-    def timeStep(self,postShip):
-        # distance to postship
-        dist = (postShip.x_loc - self.x_loc)**2 + (postShip.y_loc - self.y_loc)**2
-        limit = (self.outerSize/2.0)**2
-        # check for delivery
-        if dist < limit and not self.delivered:
-            self.delivered = True
-        
-    def collisionCheck(self,postShip):
-        # distance to postship
-        dist = (postShip.x_loc - self.x_loc)**2 + (postShip.y_loc - self.y_loc)**2
-        limit = (self.innerSize/2.0 + postShip.size/2.0)**2
-        # check for collision
-        return(dist < limit and config.precisionDelivery)
-        
-    def makeDrawer(self):
+class PostBox(SpaceModel.PostBox):
+    """Post box with a drawer."""
+    def makeDrawer(self,rng=random):
         return(PostBoxDrawer(self))
 
-    
 #------------------------------------------------------------
 # Asteroid
-class AsteroidHazard:
-    """Asteriod hazard for postship.
-    Location is (x,y) tuple.
-    Board is map board asteroid belongs on."""
-    def __init__(self,location, board, 
-                 size = config.asteroidSize):
-        # store parameters
-        self.x_loc, self.y_loc = location
-        self.board = board
-        self.size = size
-        self.delivered = True
-        
-    def timeStep(self,postShip):
-        pass
-        
-    def collisionCheck(self,postShip):
-        # distance to postship
-        dist = (postShip.x_loc - self.x_loc)**2 + (postShip.y_loc - self.y_loc)**2
-        limit = (self.size/2.0 + postShip.size/2.0)**2
-        # check for collision
-        if dist < limit:
-            return(True)
-        else:
-            return(False)
-        
-    def makeDrawer(self):
-        return(AsteroidHazardDrawer(self))
-    
-    
+class AsteroidHazard(SpaceModel.AsteroidHazard):
+    """Asteroid with a drawer."""
+    def makeDrawer(self,rng=random):
+        return(AsteroidHazardDrawer(self,rng))
+
 #------------------------------------------------------------
 # Warp out
-class WarpOut:
-    """End of level warp out.
-    Location is (x,y) tuple.
-    Board is map board warp out belongs on."""
-    def __init__(self,location, board, 
-                 outerSize = config.warpOutOuterSize,
-                 innerSize = config.warpOutInnerSize):
-        # store parameters
-        self.x_loc, self.y_loc = location
-        self.board = board
-        self.outerSize = outerSize
-        self.innerSize = innerSize
-        self.delivered = True
-        
-    def timeStep(self,postShip):
-        pass
-        
-    def collisionCheck(self,postShip):
-        # distance to postship
-        dist = (postShip.x_loc - self.x_loc)**2 + (postShip.y_loc - self.y_loc)**2
-        limit = (self.innerSize/2.0 + postShip.size/2.0)**2
-        # check for collision
-        if dist < limit:
-            return(True)
-        else:
-            return(False)
-        
-    def makeDrawer(self):
+class WarpOut(SpaceModel.WarpOut):
+    """Warp out with a drawer."""
+    def makeDrawer(self,rng=random):
         return(WarpOutDrawer(self))
 
+#------------------------------------------------------------
+# Game simulation
+class GameSimulation(SpaceModel.SimulationInstance):
+    """Simulation built from the drawable model classes."""
+    boardClass    = MapBoard
+    postShipClass = PostShip
+    postBoxClass  = PostBox
+    asteroidClass = AsteroidHazard
+    warpOutClass  = WarpOut
+
         
 #------------------------------------------------------------
 # VIEW
@@ -247,52 +92,136 @@ class WarpOut:
 # Master Drawer
 class MasterDrawer:
     """Responsible for creating and holding all the drawing
-    objects as a central place for drawing the screen."""
-    def __init__(self, board, postShip, warpOut, spaceObjects):
+    objects as a central place for drawing the screen.
+    rng picks the background crop and asteroid looks."""
+    def __init__(self, board, postShip, warpOut, spaceObjects, rng=random):
         # create component drawers
-        self.board = MapBoardDrawer(board)
-        self.postShip = postShip.makeDrawer()
-        self.warpOut = warpOut.makeDrawer()
+        self.board = MapBoardDrawer(board,rng)
+        self.postShip = postShip.makeDrawer(rng)
+        self.warpOut = warpOut.makeDrawer(rng)
         # space objects
-        self.spaceObjects = [obj.makeDrawer() for obj in spaceObjects]
+        self.spaceObjects = [obj.makeDrawer(rng) for obj in spaceObjects]
+        # board placement on screen, set by the board drawer
+        self.geometry = (modelToViewRatio,horiz_offset,verti_offset)
+        # everything that does not move, drawn once per level
+        self.staticLayer = pygame.Surface(screen.get_size()).convert()
+        self.bakeStatic()
+        # screen areas of moving elements on the last frame
+        self.previousRects = []
+        self.fullRedraw = True
         
-    def redraw(self,iFlip=True,waiting=False):
-        # clear screen before redrawing
-        screen.fill(0)
-        # draw commands
+    def invalidate(self):
+        # next frame redraws and flips the whole screen
+        self.fullRedraw = True
+        
+    def activate(self):
+        # board placement back to this view, another view may have been built since
+        global modelToViewRatio
+        global horiz_offset
+        global verti_offset
+        modelToViewRatio,horiz_offset,verti_offset = self.geometry
+        
+    def reset(self):
+        # post boxes awaiting delivery again
+        self.refreshStatic()
+        # menu may have covered the screen
+        self.invalidate()
+        
+    def bakeStatic(self,rect=None):
+        # draw everything that does not move onto the static layer
+        layer = self.staticLayer
+        if rect is None:
+            rect = layer.get_rect()
+        layer.set_clip(rect)
+        layer.fill(0)
         # back ground
-        self.board.drawMapBoard()
-        # warp out
-        self.warpOut.draw()
-        # space objects
+        self.board.drawMapBoard(layer)
+        # warp out and space objects that overlap
+        if self.warpOut.getRect().colliderect(rect):
+            self.warpOut.draw(layer)
         for obj in self.spaceObjects:
-            obj.draw()
-        # post ship
-        self.postShip.drawPostShip()
-        # redraw boundaries
-        self.board.drawBoundaries()
+            if obj.getRect().colliderect(rect):
+                obj.draw(layer)
+        # boundaries
+        self.board.drawBoundaries(layer)
+        layer.set_clip(None)
+        
+    def refreshStatic(self):
+        # re-bake areas of post boxes delivered since they were baked
+        changedRects = [obj.getRect() for obj in self.spaceObjects if obj.changed()]
+        for rect in changedRects:
+            self.bakeStatic(rect)
+        return(changedRects)
+        
+    def redraw(self,iFlip=True,waiting=False,alpha=1.0,seconds=0.0):
+        # post boxes delivered since last frame
+        changedRects = self.refreshStatic()
+        # only moving elements changed since the last frame
+        if iFlip and config.dirtyRects and not self.fullRedraw:
+            self.redrawDirty(changedRects,waiting,alpha,seconds)
+            return
+        # static layer in one blit
+        screen.blit(self.staticLayer,(0,0))
+        # post ship, kept inside the board like the boundaries do
+        screen.set_clip(self.board.getRect())
+        shipRects = self.postShip.drawPostShip(alpha)
+        screen.set_clip(None)
         # update the screen
         if iFlip:
             # draw text on board
-            self.board.drawText(waiting)
+            textRects = self.board.drawText(waiting,True,seconds)
             # flip screen
             pygame.display.flip()
+            # track moving elements for the next frame
+            self.previousRects = shipRects + textRects
+            self.fullRedraw = False
+        
+    def redrawDirty(self,changedRects,waiting=False,alpha=1.0,seconds=0.0):
+        # areas to restore: last frame's moving elements and new deliveries
+        dirtyRects = self.previousRects + changedRects
+        # restore static layer underneath
+        for rect in dirtyRects:
+            screen.blit(self.staticLayer,rect,rect)
+        # post ship, kept inside the board like the boundaries do
+        screen.set_clip(self.board.getRect())
+        shipRects = self.postShip.drawPostShip(alpha)
+        screen.set_clip(None)
+        # board text only redrawn where something was drawn over it
+        textRect = self.board.textRect
+        boardText = textRect.collidelist(dirtyRects + shipRects) != -1
+        if boardText:
+            # clean text area with the ship back on top, so the text is not blended twice
+            screen.blit(self.staticLayer,textRect,textRect)
+            screen.set_clip(textRect.clip(self.board.getRect()))
+            self.postShip.drawPostShip(alpha)
+            screen.set_clip(None)
+            dirtyRects = dirtyRects + [textRect]
+        # timer and messages
+        textRects = self.board.drawText(waiting,boardText,seconds)
+        # send changed areas to the display
+        pygame.display.update(dirtyRects + shipRects + textRects)
+        # track moving elements for the next frame
+        self.previousRects = shipRects + textRects
         
 #------------------------------------------------------------
 # Map Board Drawer
 class MapBoardDrawer:
     """Responsible for drawing the board on the game screen."""
-    def __init__(self,board):
+    def __init__(self,board,rng=random):
         # store board
         self.board = board
+        self.rng = rng
         # load assets
         self.loadAssets()
         # rescale assets
         self.scaleAssets()
         self.text,self.textRect = self.scaleText()
+        # last timer shown
+        self.timerText = None
+        self.timerImage = None
         
     def loadAssets(self):
-        self.starBackground = pygame.image.load(config.starBackground)
+        self.starBackground = AssetManager.loadImage(config.starBackground)
     
     def scaleAssets(self):
         # make key values global
@@ -314,12 +243,12 @@ class MapBoardDrawer:
         
         # scale up if necessary
         rescaleRatio = max( boardPixelWidth / self.starBackground.get_width() , boardPixelHeight / self.starBackground.get_height() , 1 )
-        tmpBackground = pygame.transform.scale(self.starBackground, (ceil(self.starBackground.get_width()*rescaleRatio),ceil(self.starBackground.get_height()*rescaleRatio)))
+        tmpBackground = AssetManager.getImage(config.starBackground, (ceil(self.starBackground.get_width()*rescaleRatio),ceil(self.starBackground.get_height()*rescaleRatio)))
         # random start point
         tmp_width = tmpBackground.get_width()
         tmp_height = tmpBackground.get_height()
-        x_start = randint(0,tmpBackground.get_width()  - boardPixelWidth)
-        y_start = randint(0,tmpBackground.get_height() - boardPixelHeight)
+        x_start = self.rng.randint(0,tmpBackground.get_width()  - boardPixelWidth)
+        y_start = self.rng.randint(0,tmpBackground.get_height() - boardPixelHeight)
         # clip out
         subimage = tmpBackground.subsurface(x_start,y_start,int(boardPixelWidth),int(boardPixelHeight))
         # save
@@ -327,20 +256,10 @@ class MapBoardDrawer:
         self.starBackground = subimage
     
     def scaleText(self):
-        # initial font size
-        fontSize = config.messageSize
-        # iterate until satisfied
-        while True:
-            # title text
-            font = pygame.font.Font('FreeSansBold.ttf', fontSize)
-            text = font.render(self.board.text, True, config.WHITE)
-            # get widths
-            textWidth = text.get_width()
-            # check fits
-            if (textWidth < screenWidth):
-                break
-            else:
-                fontSize = int(fontSize / 1.2)
+        # largest font size that fits
+        fontSize = FontCache.fitFontSize([self.board.text], config.messageSize, screenWidth)
+        # title text
+        text = FontCache.renderText(self.board.text, fontSize)
         # rectangles containing text
         textRect = text.get_rect()
         # locate rectangles horizontally
@@ -349,41 +268,49 @@ class MapBoardDrawer:
         # store
         return(text, textRect)
     
-    def drawMapBoard(self):
+    def getRect(self):
+        # screen area of the board
+        return(Rect(horiz_offset,verti_offset,self.starBackground.get_width(),self.starBackground.get_height()))
+    
+    def drawMapBoard(self,target=None):
+        # draw on screen unless told otherwise
+        if target is None:
+            target = screen
         # draw background
-        screen.blit(self.starBackground,(horiz_offset,verti_offset))
+        target.blit(self.starBackground,(horiz_offset,verti_offset))
         
-    def drawBoundaries(self):
+    def drawBoundaries(self,target=None):
+        # draw on screen unless told otherwise
+        if target is None:
+            target = screen
         # top rectangle
         left_edge = 0
         top_edge = 0
         width = screenWidth
         height = verti_offset
-        pygame.draw.rect(screen, config.BLACK, (left_edge,top_edge,width,height))
+        pygame.draw.rect(target, config.BLACK, (left_edge,top_edge,width,height))
         # bottom rectangle
         left_edge = 0
         top_edge = verti_offset + self.starBackground.get_height()
         width = screenWidth
         height = screenHeight - top_edge
-        pygame.draw.rect(screen, config.BLACK, (left_edge,top_edge,width,height))
+        pygame.draw.rect(target, config.BLACK, (left_edge,top_edge,width,height))
         # left rectangle
         left_edge = 0
         top_edge = 0
         width = horiz_offset
         height = screenHeight
-        pygame.draw.rect(screen, config.BLACK, (left_edge,top_edge,width,height))        
+        pygame.draw.rect(target, config.BLACK, (left_edge,top_edge,width,height))        
         # right rectangle
         left_edge = horiz_offset + self.starBackground.get_width()
         top_edge = 0
         width = screenWidth - left_edge
         height = screenHeight
-        pygame.draw.rect(screen, config.BLACK, (left_edge,top_edge,width,height))
+        pygame.draw.rect(target, config.BLACK, (left_edge,top_edge,width,height))
         
-    def drawText(self,waiting=False):
-        # current time
-        nowTime = pygame.time.get_ticks()
-        # elapsed time
-        elapsedSeconds = (nowTime - startTime)/1000
+    def drawText(self,waiting=False,boardText=True,seconds=0.0):
+        # flight time from the simulation
+        elapsedSeconds = seconds
         # display time
         secs = elapsedSeconds % 60
         mins = (elapsedSeconds - secs)/60
@@ -392,27 +319,30 @@ class MapBoardDrawer:
         displayAt = (10,10)
         # text to display
         text = str(int(mins))+":"+str(round(secs,1))
-        # timer text
-        font = pygame.font.Font('FreeSansBold.ttf', config.timerSize)
-        text = font.render(text, True, config.WHITE)
+        # timer text, rendered when the shown value changes
+        if text != self.timerText:
+            self.timerText = text
+            self.timerImage = FontCache.getFont(config.timerSize).render(text, True, config.WHITE)
         
         # draw time
-        screen.blit(text, displayAt)
-        # draw text
-        screen.blit(self.text, self.textRect)
+        drawnRects = [screen.blit(self.timerImage, displayAt)]
+        # draw text, it never moves so it is not returned
+        if boardText:
+            screen.blit(self.text, self.textRect)
         
         # if waiting inform player
         if waiting:
             # message
             text = 'Ready'
             # waiting text
-            font = pygame.font.Font('FreeSansBold.ttf', config.waitingSize)
-            text = font.render(text, True, config.WHITE)
+            text = FontCache.renderText(text, config.waitingSize)
             # draw location
             textRect = text.get_rect()
             textRect.center = (screenWidth/2,screenHeight/2)
             # draw text
-            screen.blit(text, textRect)
+            drawnRects.append(screen.blit(text, textRect))
+        # areas drawn: timer, then any message
+        return(drawnRects)
         
         
 #------------------------------------------------------------
@@ -428,90 +358,89 @@ class PostShipEasyDrawer:
         self.scaleAssets()
         
     def loadAssets(self):
-        self.shipImage = pygame.image.load(config.easyShip)
-        self.engineFire = pygame.image.load(config.engineFire)
+        self.shipImage = AssetManager.loadImage(config.easyShip)
+        self.engineFire = AssetManager.loadImage(config.engineFire)
     
     def scaleAssets(self):
         # rescale ship image
         rescaleRatio = modelToViewRatio * self.postShip.size / (self.shipImage.get_height() - 4)
         new_width  = ceil(self.shipImage.get_width()  * rescaleRatio)
         new_height = ceil(self.shipImage.get_height() * rescaleRatio)
-        # save ship image
-        self.shipImage = pygame.transform.smoothscale(self.shipImage, (new_width, new_height))
-        # prep for blit
-        self.shipImage = self.shipImage.convert_alpha()
+        # save ship image, prepped for blit
+        self.shipImage = AssetManager.getImage(config.easyShip, (new_width, new_height), 0, 'alpha', True)
         
         # rescale engine fire
         new_width  = ceil(self.engineFire.get_width()  * rescaleRatio)
         new_height = ceil(self.engineFire.get_height() * rescaleRatio)
-        # save fire
-        self.engineFireTop = pygame.transform.smoothscale(self.engineFire, (new_width, new_height))
-        # prep for blit
-        self.engineFireTop = self.engineFireTop.convert_alpha()
+        # save fire, prepped for blit
+        self.engineFireTop = AssetManager.getImage(config.engineFire, (new_width, new_height), 0, 'alpha', True)
         
         # rotate engine fire
-        self.engineFireLeft   = pygame.transform.rotate(self.engineFireTop, 90)
-        self.engineFireBottom = pygame.transform.rotate(self.engineFireTop,180)
-        self.engineFireRight  = pygame.transform.rotate(self.engineFireTop,270)
+        self.engineFireLeft   = AssetManager.getImage(config.engineFire, (new_width, new_height), 90, 'alpha', True)
+        self.engineFireBottom = AssetManager.getImage(config.engineFire, (new_width, new_height),180, 'alpha', True)
+        self.engineFireRight  = AssetManager.getImage(config.engineFire, (new_width, new_height),270, 'alpha', True)
         
-    def drawPostShip(self):
-        # post ship position
-        x_loc = int(0.5 + self.postShip.x_loc*modelToViewRatio)+horiz_offset
-        y_loc = int(0.5 + self.postShip.y_loc*modelToViewRatio)+verti_offset
+    def drawPostShip(self,alpha=1.0):
+        # post ship position between the last two steps
+        ship_x, ship_y = self.postShip.drawLocation(alpha)
+        x_loc = int(0.5 + ship_x*modelToViewRatio)+horiz_offset
+        y_loc = int(0.5 + ship_y*modelToViewRatio)+verti_offset
         # align
         tmpRect = self.shipImage.get_rect()
         tmpRect.centerx = x_loc
         tmpRect.centery = y_loc
         # blit
-        screen.blit(self.shipImage, tmpRect)
+        drawnRects = [screen.blit(self.shipImage, tmpRect)]
         ##pygame.draw.circle(screen, config.GREEN, (x_loc,y_loc), round(self.postShip.size*modelToViewRatio/2), 0)
         # engine offset
         engOffset = self.postShip.size/2.0 + config.engineOffset
         # engines
         if self.postShip.moveUp:
             # position
-            x_loc = int(0.5 +  self.postShip.x_loc             *modelToViewRatio)+horiz_offset
-            y_loc = int(0.5 + (self.postShip.y_loc + engOffset)*modelToViewRatio)+verti_offset
+            x_loc = int(0.5 +  ship_x             *modelToViewRatio)+horiz_offset
+            y_loc = int(0.5 + (ship_y + engOffset)*modelToViewRatio)+verti_offset
             # align
             tmpRect = self.engineFireBottom.get_rect()
             tmpRect.centerx = x_loc
             tmpRect.centery = y_loc
             # blit
-            screen.blit(self.engineFireBottom, tmpRect)
+            drawnRects.append(screen.blit(self.engineFireBottom, tmpRect))
             ##pygame.draw.circle(screen, config.RED, (x_loc,y_loc), int(0.5 + self.postShip.size*modelToViewRatio/10), 0)
         if self.postShip.moveDown:
             # position
-            x_loc = int(0.5 +  self.postShip.x_loc             *modelToViewRatio)+horiz_offset
-            y_loc = int(0.5 + (self.postShip.y_loc - engOffset)*modelToViewRatio)+verti_offset
+            x_loc = int(0.5 +  ship_x             *modelToViewRatio)+horiz_offset
+            y_loc = int(0.5 + (ship_y - engOffset)*modelToViewRatio)+verti_offset
             # align
             tmpRect = self.engineFireTop.get_rect()
             tmpRect.centerx = x_loc
             tmpRect.centery = y_loc
             # blit
-            screen.blit(self.engineFireTop, tmpRect)
+            drawnRects.append(screen.blit(self.engineFireTop, tmpRect))
             ##pygame.draw.circle(screen, config.RED, (x_loc,y_loc), int(0.5 + self.postShip.size*modelToViewRatio/10), 0)
         if self.postShip.moveLeft:
             # position
-            x_loc = int(0.5 + (self.postShip.x_loc + engOffset)*modelToViewRatio)+horiz_offset
-            y_loc = int(0.5 +  self.postShip.y_loc             *modelToViewRatio)+verti_offset
+            x_loc = int(0.5 + (ship_x + engOffset)*modelToViewRatio)+horiz_offset
+            y_loc = int(0.5 +  ship_y             *modelToViewRatio)+verti_offset
             # align
             tmpRect = self.engineFireRight.get_rect()
             tmpRect.centerx = x_loc
             tmpRect.centery = y_loc
             # blit
-            screen.blit(self.engineFireRight, tmpRect)
+            drawnRects.append(screen.blit(self.engineFireRight, tmpRect))
             ##pygame.draw.circle(screen, config.RED, (x_loc,y_loc), int(0.5 + self.postShip.size*modelToViewRatio/10), 0)
         if self.postShip.moveRight:
             # position
-            x_loc = int(0.5 + (self.postShip.x_loc - engOffset)*modelToViewRatio)+horiz_offset
-            y_loc = int(0.5 +  self.postShip.y_loc             *modelToViewRatio)+verti_offset
+            x_loc = int(0.5 + (ship_x - engOffset)*modelToViewRatio)+horiz_offset
+            y_loc = int(0.5 +  ship_y             *modelToViewRatio)+verti_offset
             # align
             tmpRect = self.engineFireLeft.get_rect()
             tmpRect.centerx = x_loc
             tmpRect.centery = y_loc
             # blit
-            screen.blit(self.engineFireLeft, tmpRect)
+            drawnRects.append(screen.blit(self.engineFireLeft, tmpRect))
             ##pygame.draw.circle(screen, config.RED, (x_loc,y_loc), int(0.5 + self.postShip.size*modelToViewRatio/10), 0)
+        # areas drawn
+        return(drawnRects)
 
 #------------------------------------------------------------
 # Post Ship Drawer - Hard
@@ -526,59 +455,61 @@ class PostShipHardDrawer:
         self.scaleAssets()
         
     def loadAssets(self):
-        self.shipImage = pygame.image.load(config.hardShip)
-        self.engineFire = pygame.image.load(config.engineFire)
+        self.shipImage = AssetManager.loadImage(config.hardShip)
+        self.engineFire = AssetManager.loadImage(config.engineFire)
     
     def scaleAssets(self):
         # rescale ship image
         rescaleRatio = modelToViewRatio * self.postShip.size / (self.shipImage.get_height() - 4)
         new_width  = ceil(self.shipImage.get_width()  * rescaleRatio)
         new_height = ceil(self.shipImage.get_height() * rescaleRatio)
-        # save ship image
-        self.shipImage = pygame.transform.smoothscale(self.shipImage, (new_width, new_height))
-        # prep for blit
-        self.shipImage = self.shipImage.convert_alpha()
+        # ship image at every angle, prepped for blit
+        self.shipImages = AssetManager.RotationCache(config.hardShip, (new_width, new_height))
         
         # rescale engine fire
         new_width  = ceil(self.engineFire.get_width()  * rescaleRatio)
         new_height = ceil(self.engineFire.get_height() * rescaleRatio)
-        # rotate
-        self.engineFire = pygame.transform.rotate(self.engineFire,180)
-        # save fire
-        self.engineFire = pygame.transform.smoothscale(self.engineFire, (new_width, new_height))
-        # prep for blit
-        self.engineFire = self.engineFire.convert_alpha()
+        # fire pointing backwards at every angle, prepped for blit
+        self.engineFires = AssetManager.RotationCache(config.engineFire, (new_width, new_height), 180)
+        
+        # rotate now rather than during play
+        if config.warmRotations:
+            self.shipImages.warm()
+            self.engineFires.warm()
         
-    def drawPostShip(self):
-        # post ship position
-        x_loc = int(0.5 + self.postShip.x_loc*modelToViewRatio)+horiz_offset
-        y_loc = int(0.5 + self.postShip.y_loc*modelToViewRatio)+verti_offset
+    def drawPostShip(self,alpha=1.0):
+        # post ship position between the last two steps
+        ship_x, ship_y = self.postShip.drawLocation(alpha)
+        x_loc = int(0.5 + ship_x*modelToViewRatio)+horiz_offset
+        y_loc = int(0.5 + ship_y*modelToViewRatio)+verti_offset
         # rotate
         degrees = self.postShip.radians/(2*pi)*360
-        tmpImage = pygame.transform.rotate(self.shipImage, degrees)
+        tmpImage = self.shipImages.get(degrees)
         # align
         tmpRect = tmpImage.get_rect()
         tmpRect.centerx = x_loc
         tmpRect.centery = y_loc
         # blit
-        screen.blit(tmpImage, tmpRect)
+        drawnRects = [screen.blit(tmpImage, tmpRect)]
         ##pygame.draw.circle(screen, config.GREEN, (x_loc,y_loc), round(self.postShip.size*modelToViewRatio/2), 0)
         # engines
         if self.postShip.move:
             # position
             x_adjust = (self.postShip.size/2.0 + config.engineOffset) * sin(self.postShip.radians + pi)
             y_adjust = (self.postShip.size/2.0 + config.engineOffset) * cos(self.postShip.radians + pi)
-            x_loc = int(0.5 + (self.postShip.x_loc - x_adjust) * modelToViewRatio)+horiz_offset
-            y_loc = int(0.5 + (self.postShip.y_loc - y_adjust) * modelToViewRatio)+verti_offset
+            x_loc = int(0.5 + (ship_x - x_adjust) * modelToViewRatio)+horiz_offset
+            y_loc = int(0.5 + (ship_y - y_adjust) * modelToViewRatio)+verti_offset
             # rotate
-            tmpImage = pygame.transform.rotate(self.engineFire, degrees)
+            tmpImage = self.engineFires.get(degrees)
             # align
             tmpRect = tmpImage.get_rect()
             tmpRect.centerx = x_loc
             tmpRect.centery = y_loc
             # blit
-            screen.blit(tmpImage, tmpRect)
+            drawnRects.append(screen.blit(tmpImage, tmpRect))
             ##pygame.draw.circle(screen, config.RED, (x_loc,y_loc), int(0.5 + self.postShip.size*modelToViewRatio/10), 0)
+        # areas drawn
+        return(drawnRects)
 
 #------------------------------------------------------------
 # Post Box Drawer
@@ -587,6 +518,8 @@ class PostBoxDrawer:
     def __init__(self,postBox):
         # store parameters
         self.postBox = postBox
+        # delivery state last drawn
+        self.drawnDelivered = postBox.delivered
         # load assets
         self.loadAssets()
         # rescale assets
@@ -596,39 +529,78 @@ class PostBoxDrawer:
         pass
     
     def scaleAssets(self):
-        pass
+        # pixel size of delivery zone and post box
+        self.zoneSize = int(0.5 + self.postBox.outerSize*modelToViewRatio)
+        self.boxRadius = int(0.5 + self.postBox.innerSize*modelToViewRatio/2.0)
+        # sprites shared by every post box of the same size
+        zoneKey = ('deliveryZone', self.postBox.outerSize, self.postBox.innerSize, modelToViewRatio, config.transLIGHTGREY)
+        self.zoneImage = AssetManager.getOrMake(zoneKey, self.makeZoneImage)
+        boxKey = ('postBox', self.postBox.outerSize, self.postBox.innerSize, modelToViewRatio, config.TEAL)
+        self.boxImage = AssetManager.getOrMake(boxKey, self.makeBoxImage)
+    
+    def makeZoneImage(self):
+        ## draw with only delivery areas transparent - almost as fast as no transparency
+        size = self.zoneSize
+        # transparent sub screen
+        s = pygame.Surface((size,size), pygame.SRCALPHA)
+        # draw circle
+        pygame.draw.circle(s, config.transLIGHTGREY,  (int(0.5 + size/2.0),int(0.5 + size/2.0)), int(0.5 + size/2.0), 0)
+        # display format blends fastest
+        return(s.convert_alpha())
+    
+    def makeBoxImage(self):
+        # square just holding the circle
+        radiu = self.boxRadius
+        s = pygame.Surface((2*radiu+1,2*radiu+1)).convert()
+        # corners see through, circle is opaque so no blending needed
+        s.fill(config.BLACK)
+        s.set_colorkey(config.BLACK, pygame.RLEACCEL)
+        # draw circle
+        pygame.draw.circle(s, config.TEAL, (radiu,radiu), radiu, 0)
+        return(s)
     
-    def draw(self):
+    def changed(self):
+        # delivered since last drawn
+        return(self.drawnDelivered != self.postBox.delivered)
+    
+    def getRect(self):
+        # screen area of delivery zone
+        size = int(0.5 + self.postBox.outerSize*modelToViewRatio)
+        rect = Rect(0,0,size+2,size+2)
+        rect.center = (int(0.5 + self.postBox.x_loc*modelToViewRatio)+horiz_offset,int(0.5 + self.postBox.y_loc*modelToViewRatio)+verti_offset)
+        return(rect)
+    
+    def draw(self,target=None):
+        # draw on screen unless told otherwise
+        if target is None:
+            target = screen
+        # remember state drawn
+        self.drawnDelivered = self.postBox.delivered
         # target area if awaiting delivery
         if not self.postBox.delivered:
-            ## draw with only delivery areas transparent - almost as fast as no transparency
-            # pizel size of post box
-            size = int(0.5 + self.postBox.outerSize*modelToViewRatio)
-            # transparent sub screen
-            s = pygame.Surface((size,size), pygame.SRCALPHA)
-            # draw circle
-            pygame.draw.circle(s, config.transLIGHTGREY,  (int(0.5 + size/2.0),int(0.5 + size/2.0)), int(0.5 + size/2.0), 0)
-            screen.blit(s, (int(0.5 + self.postBox.x_loc*modelToViewRatio-size/2.0)+horiz_offset,int(0.5 + self.postBox.y_loc*modelToViewRatio-size/2.0)+verti_offset))
+            size = self.zoneSize
+            target.blit(self.zoneImage, (int(0.5 + self.postBox.x_loc*modelToViewRatio-size/2.0)+horiz_offset,int(0.5 + self.postBox.y_loc*modelToViewRatio-size/2.0)+verti_offset))
         # draw post box itself
         x_loc = int(0.5 + self.postBox.x_loc*modelToViewRatio)+horiz_offset
         y_loc = int(0.5 + self.postBox.y_loc*modelToViewRatio)+verti_offset
-        radiu = int(0.5 + self.postBox.innerSize*modelToViewRatio/2.0)
-        pygame.draw.circle(screen, config.TEAL, (x_loc,y_loc), radiu, 0)
+        radiu = self.boxRadius
+        target.blit(self.boxImage, (x_loc-radiu,y_loc-radiu))
 
 #------------------------------------------------------------
 # Asteroid Hazard Drawer
 class AsteroidHazardDrawer:
     """Responsible for drawing asteroids on the game screen."""
-    def __init__(self,asteroidHazard):
+    def __init__(self,asteroidHazard,rng=random):
         # store parameters
         self.asteroid = asteroidHazard
+        self.rng = rng
         # load assets
         self.loadAssets()
         # rescale assets
         self.scaleAssets()
         
     def loadAssets(self):
-        num = randint(1,18)
+        num = self.rng.randint(1,18)
         if num == 1:
             filename = config.asteroid01
         elif num == 2:
@@ -666,35 +638,46 @@ class AsteroidHazardDrawer:
         elif num == 18:
             filename = config.asteroid18
         # load file
-        self.asteroidTexture = pygame.image.load(filename)
+        self.asteroidFile = filename
+        self.asteroidTexture = AssetManager.loadImage(filename)
     
     def scaleAssets(self):
         # rescale image
         rescaleRatio = modelToViewRatio * self.asteroid.size / (self.asteroidTexture.get_width() - 4)
         new_width  = ceil(self.asteroidTexture.get_width() * rescaleRatio)
         new_height = ceil(self.asteroidTexture.get_height()* rescaleRatio)
-        tmpImage = pygame.transform.scale(self.asteroidTexture, (new_width,new_height))
         # rotate
-        degrees = randint(0,360)
-        tmpImage = pygame.transform.rotate(tmpImage, degrees)
+        degrees = self.rng.randint(0,360)
         # set transparency
-        tmpImage = tmpImage.convert_alpha()
+        tmpImage = AssetManager.getImage(self.asteroidFile, (new_width,new_height), degrees, 'alpha')
         ##tmpImage.set_colorkey(config.WHITE)
         # save
         self.asteroidTexture = tmpImage
         
-    def draw(self):
+    def getRect(self):
         # location
         x_loc = int(0.5 + self.asteroid.x_loc*modelToViewRatio)+horiz_offset
         y_loc = int(0.5 + self.asteroid.y_loc*modelToViewRatio)+verti_offset
-        ##radiu = int(0.5 + self.asteroid.size*modelToViewRatio/2.0)
         # set location
         asteroidRect = self.asteroidTexture.get_rect()
         asteroidRect.centerx = x_loc
         asteroidRect.centery = y_loc
-        ##pygame.draw.circle(screen, config.BROWN, (x_loc,y_loc), radiu, 0)
+        return(asteroidRect)
+    
+    def changed(self):
+        # asteroids look the same all level
+        return(False)
+        
+    def draw(self,target=None):
+        # draw on screen unless told otherwise
+        if target is None:
+            target = screen
+        # location
+        asteroidRect = self.getRect()
+        ##radiu = int(0.5 + self.asteroid.size*modelToViewRatio/2.0)
+        ##pygame.draw.circle(target, config.BROWN, (x_loc,y_loc), radiu, 0)
         # draw texture
-        screen.blit(self.asteroidTexture, asteroidRect)
+        target.blit(self.asteroidTexture, asteroidRect)
 
 #------------------------------------------------------------
 # Warp Out Drawer
@@ -710,32 +693,39 @@ class WarpOutDrawer:
         
     def loadAssets(self):
         # load file
-        self.warpOutTexture = pygame.image.load(config.warpOut)
+        self.warpOutTexture = AssetManager.loadImage(config.warpOut)
     
     def scaleAssets(self):
         # rescale image
         rescaleRatio = modelToViewRatio * self.warpOut.outerSize / (self.warpOutTexture.get_width() - 4)
         new_width  = ceil(self.warpOutTexture.get_width() * rescaleRatio)
         new_height = ceil(self.warpOutTexture.get_height()* rescaleRatio)
-        tmpImage = pygame.transform.scale(self.warpOutTexture, (new_width,new_height))
         # set transparency
-        tmpImage = tmpImage.convert_alpha()
+        tmpImage = AssetManager.getImage(config.warpOut, (new_width,new_height), 0, 'alpha')
         ##tmpImage.set_colorkey(config.WHITE)
         # save
         self.warpOutTexture = tmpImage
         
-    def draw(self):
+    def getRect(self):
         # location
         x_loc = int(0.5 + self.warpOut.x_loc*modelToViewRatio)+horiz_offset
         y_loc = int(0.5 + self.warpOut.y_loc*modelToViewRatio)+verti_offset
-        ##radiu = int(0.5 + self.asteroid.size*modelToViewRatio/2.0)
         # set location
         warpOutRect = self.warpOutTexture.get_rect()
         warpOutRect.centerx = x_loc
         warpOutRect.centery = y_loc
-        ##pygame.draw.circle(screen, config.BROWN, (x_loc,y_loc), radiu, 0)
+        return(warpOutRect)
+        
+    def draw(self,target=None):
+        # draw on screen unless told otherwise
+        if target is None:
+            target = screen
+        # location
+        warpOutRect = self.getRect()
+        ##radiu = int(0.5 + self.asteroid.size*modelToViewRatio/2.0)
+        ##pygame.draw.circle(target, config.BROWN, (x_loc,y_loc), radiu, 0)
         # draw texture
-        screen.blit(self.warpOutTexture, warpOutRect)
+        target.blit(self.warpOutTexture, warpOutRect)
 
 #------------------------------------------------------------
 # CONTROLLER
@@ -744,18 +734,26 @@ class WarpOutDrawer:
 #------------------------------------------------------------
 # Game instance
 class GameInstance:
-    """General stuff for creating and being a game"""
-    def __init__(self,screen,gameType,numLevel):
+    """General stuff for creating and being a game.
+    seed fixes the random layout and looks of the first level."""
+    def __init__(self,screen,gameType,numLevel,seed=None):
         # data storage object
-        self.data = DataHands.loadJson()
+        self.data = DataHands.store
+        self.easyControls = self.data.get('easyControls')
         # globalize screen
         self.globalize(screen)
         screen.fill(0)
         # store type and level
         self.gameType = gameType
         self.numLevel = numLevel
+        # next level built during the end-of-level menu
+        self.prefetched = None
+        # level source edited since the level was built
+        self.levelChanged = False
+        # with config.watchLevels, start watching before the level is read
+        changedLevels(self.gameType)
         # game model and view
-        self.createPoints()
+        self.createPoints(seed)
         self.createModel()
         self.createView()
         
@@ -772,15 +770,19 @@ class GameInstance:
         screenWidth = screen.get_width()
         screenHeight = screen.get_height()
         screenRect = screen.get_rect()
-        # additional globalize
-        global startTime
-        global easyControls
-        startTime = pygame.time.get_ticks()
-        easyControls = self.data['easyControls']
     
-    def createPoints(self):
+    def createPoints(self,seed=None):
+        # seed for layout and cosmetics
+        if seed is None:
+            seed = nextSeed(self.gameType)
         # get level
-        xmax,ymax,postShip_loc,warpOut_loc,postBox_locs,asteroid_locs,text,text_loc = getLevel(self.gameType,self.numLevel)
+        self.setLevel(seed,getLevel(self.gameType,self.numLevel,seed=seed))
+        
+    def setLevel(self,seed,level):
+        # seed and level tuple
+        self.seed = seed
+        self.level = level
+        xmax,ymax,postShip_loc,warpOut_loc,postBox_locs,asteroid_locs,text,text_loc = self.level
         # store
         self.xmax = xmax
         self.ymax = ymax
@@ -792,69 +794,100 @@ class GameInstance:
         self.text_loc = text_loc
         
     def createModel(self):
-        # new map board
-        self.board = MapBoard(self.xmax,self.ymax,self.text,self.text_loc)
-        # new post ship
-        self.postShip = PostShip(self.postShip_loc,self.board)
-        # new warp out
-        self.warpOut = WarpOut(self.warpOut_loc,self.board)
-        # other space objects
-        self.spaceObjects = []
-        # add 3 post boxes
-        for loc in self.postBox_locs:
-            # new post box
-            self.spaceObjects.append(PostBox(loc,self.board))
-        # add remaining asteroid hazard
-        for loc in self.asteroid_locs:
-            # new asteroid
-            self.spaceObjects.append(AsteroidHazard(loc,self.board))        
+        # new simulation
+        self.setModel(GameSimulation(self.level,self.easyControls))
+        
+    def setModel(self,sim):
+        self.sim = sim
+        # model objects used by the view and controls
+        self.board = self.sim.board
+        self.postShip = self.sim.postShip
+        self.warpOut = self.sim.warpOut
+        self.spaceObjects = self.sim.spaceObjects
         
     def createView(self):
         # new master drawer
-        self.view = MasterDrawer(self.board,self.postShip,self.warpOut,self.spaceObjects)
+        self.view = self.makeView(self.seed,self.sim)
+        
+    def makeView(self,seed,sim):
+        # same looks every time the level is built
+        rng = RandomStreams(seed).cosmetic
+        # new master drawer
+        return(MasterDrawer(sim.board,sim.postShip,sim.warpOut,sim.spaceObjects,rng))
+    
+    def nextLevelNumber(self):
+        # random levels are told apart by seed, not number
+        if self.gameType == 'random':
+            return(self.numLevel)
+        # campaign wraps back to the first level, however many the pack holds
+        if self.numLevel >= numLevels(self.gameType):
+            return(1)
+        return(self.numLevel + 1)
+    
+    def prefetch(self):
+        '''returns the idle work that builds the next training level
+        while the end-of-level menu waits for input, or None'''
+        self.prefetched = None
+        if self.gameType == 'training':
+            return(self.buildNext)
+        return(None)
+    
+    def buildNext(self):
+        '''builds one piece of the next level, the model then the view.
+        Returns True while there is more to build.'''
+        # same steps as createPoints and createModel, kept aside
+        if self.prefetched is None:
+            numLevel = self.nextLevelNumber()
+            seed = nextSeed(self.gameType)
+            level = getLevel(self.gameType,numLevel,seed=seed)
+            self.prefetched = [numLevel,seed,level,GameSimulation(level,self.easyControls)]
+            return(True)
+        # same as createView, then the current level's placement back for Replay
+        numLevel,seed,level,sim = self.prefetched
+        self.prefetched.append(self.makeView(seed,sim))
+        self.view.activate()
+        return(False)
+    
+    def takePrefetched(self,wanted=True):
+        '''returns [numLevel,seed,level,sim] with the view appended
+        if it was built in time, or None'''
+        prefetched = self.prefetched if wanted else None
+        self.prefetched = None
+        return(prefetched)
     
     def runGame(self):
         # clock
         fpsClock = pygame.time.Clock()
-        global startTime
-        startTime = pygame.time.get_ticks()
         # preparation
         running = 1
         status = "continue"
-        self.data['numAttempts'] += 1
+        self.data.increment('numAttempts')
         # keep looping through
         while running:
-            # reset clock
-            if self.postShip.waiting:
-                startTime = pygame.time.get_ticks()
-            # redraw screen
-            self.view.redraw(waiting = self.postShip.waiting)
+            # redraw screen, the timer shows simulated flight time
+            self.view.redraw(waiting = self.postShip.waiting, alpha = self.sim.interpolation(), seconds = self.sim.flightSeconds())
             # resolve events
             running, status = self.resolveEvents(pygame.event.get(),running,status)
-            # increment model time
-            # for post ship
-            self.postShip.timeStep(config.dt)
-            # for space objects
-            for obj in self.spaceObjects:
-                obj.timeStep(self.postShip)
+            # Handle FPS
+            ## lock FPS (upper bound on rendering only)
+            frameSeconds = fpsClock.tick(config.FPS) / 1000.0
+            # increment model time in fixed steps
             # check for game over conditions
-            running, status = self.checkEndGameConditions(running,status)
+            if running:
+                running, status = self.checkEndGameConditions(self.sim.advance(frameSeconds,config.simSpeed),running,status)
             # Act on game not being in continue status
             running, status = self.handleStatus(running,status)
-            # Handle FPS
-            ## lock FPS
-            fpsClock.tick(config.FPS)
             ## find FPS (requires break post to read)
             #fpsClock.tick()
             #this_FPS = fpsClock.get_fps()
         
         # game has ended
-        DataHands.saveJson(self.data)
+        self.data.flush()
         return(status)
             
     def resolveKeyDown(self,keyPressed):
         # track keys if using easy controls
-        if easyControls:
+        if self.easyControls:
             if (keyPressed == K_UP) | (keyPressed == K_w):
                 self.postShip.moveUp = True
             elif (keyPressed == K_LEFT) | (keyPressed == K_a):
@@ -869,7 +902,7 @@ class GameInstance:
             
     def resolveKeyUp(self,keyPressed):
         # track keys if using easy controls
-        if easyControls:
+        if self.easyControls:
             if (keyPressed == K_UP) | (keyPressed == K_w):
                 self.postShip.moveUp = False
             elif (keyPressed == K_LEFT) | (keyPressed == K_a):
@@ -902,6 +935,10 @@ class GameInstance:
                 # stop game
                 running = 0
                 status = 'abort'
+            # check if event is quick retry
+            if (event.type == KEYDOWN) and (event.key == K_r):
+                # restart level
+                status = 'Replay'
             
             # EASY SHIP CONTROLS
             # key down
@@ -915,62 +952,38 @@ class GameInstance:
             
             # HARD SHIP CONTROLS
             # mouse down
-            if not easyControls and event.type == pygame.MOUSEBUTTONDOWN:
+            if not self.easyControls and event.type == pygame.MOUSEBUTTONDOWN:
                 # left mouse button only
                 if event.button == 1:
                     self.postShip.move = True
             # mouse up
-            if not easyControls and event.type == pygame.MOUSEBUTTONUP:
+            if not self.easyControls and event.type == pygame.MOUSEBUTTONUP:
                 # left mouse button only
                 if event.button == 1:
                     self.postShip.move = False
         
         # track mouse
-        if not easyControls:
+        if not self.easyControls:
             self.postShip.computeRadians(pygame.mouse.get_pos())        
         # all events resolved
         return((running,status))
     
-    def checkEndGameConditions(self,running,status):
+    def checkEndGameConditions(self,simStatus,running,status):
         # default = no change
-        # lost in space
-        if self.postShip.lostInSpace():
-            # we are lost
-            running = 0
-            status = 'lost'
-            self.data['numLost'] += 1
-        # collision
-        collision = [obj.collisionCheck(self.postShip) for obj in self.spaceObjects]
-        if any(collision):
-            # we have crashed
-            running = 0
-            status = 'crashed'
-            self.data['numCrashes'] += 1
-        # all mail delivered
-        delivered = [obj.delivered for obj in self.spaceObjects]
-        atWormHole = self.warpOut.collisionCheck(self.postShip)
-        if atWormHole and not all(delivered):
-            # we have warped out early
-            running = 0
-            status = 'early'
-            self.data['numEarly'] += 1
-        elif atWormHole and all(delivered):
-            # we have completed mail run
-            running = 0
-            status = 'complete'
-            self.data['numComplete'] += 1
-        
+        if simStatus == 'continue':
+            return((running,status))
+        # game over
+        running = 0
+        status = simStatus
         # all conditions checked
         return((running,status))
     
     def handleStatus(self,running,status):
-        # current time
-        nowTime = pygame.time.get_ticks()
-        # start time is global
-        global startTime
         # default = no change
         if status == 'continue':
             return((running,status))
+        # no level built ahead yet
+        prefetched = None
         # GAME END STATUS
         if status in ['lost','crashed','early','complete']:
             # select transparency color
@@ -984,8 +997,13 @@ class GameInstance:
             s.fill(transCol)
             screen.blit(s, (0,0))
             pygame.display.flip()
-            # save image
-            pygame.image.save(screen,config.tmpMenuBackgrd)
+            # keep image for menu background
+            menuBackground = screen.copy()
+            # store outcome
+            # flight time from the fixed steps, not the wall clock
+            secondsElapsed = round(self.sim.flightSeconds(),1)
+            standing = self.standing(status,secondsElapsed)
+            self.storeAttempt(status,secondsElapsed)
             # text
             if status == 'lost':
                 text1 = "Deliveries Failed"
@@ -997,14 +1015,25 @@ class GameInstance:
                 text1 = "Deliveries Failed"
                 text2 = "Warped out without delivering mail"
             else:
-                secondsElapsed = round((nowTime - startTime)/1000,1)
-                self.storeSeconds(secondsElapsed)
                 timeText = str(secondsElapsed)+"sec"
                 text1 = "Good work!"
                 text2 = "All mail delivered in "+timeText
+                # personal best and standing
+                if standing is not None:
+                    bestText = str(self.data.levelStats(self.easyControls,self.numLevel).best())+"sec"
+                    text2 += " (best "+bestText+", faster than "+str(standing)+"% of your runs)"
+            # pick up edited levels before building the next one
+            self.checkLevels()
+            # edited levels that could not be loaded
+            problems = levelProblems(self.gameType)
+            if problems:
+                text2 += " (not loaded "+"; ".join(problems)+")"
             # call menu
-            MI = MenuInstance(screen, text1, text2,['Menu','New','Replay'],config.tmpMenuBackgrd)
-            status = MI.run(status=="complete")
+            MI = MenuInstance(screen, text1, text2,['Menu','New','Replay'],menuBackground,hotkeys={K_r:'Replay'})
+            # build next level while the player reads the menu
+            status = MI.run(status=="complete",self.prefetch())
+            # next level only kept if asked for
+            prefetched = self.takePrefetched(status == 'New')
         
         # STATUS FROM MENU INSTANCE
         # return to main menu
@@ -1014,39 +1043,72 @@ class GameInstance:
             running = 0
         # replay
         if status == 'Replay':
-            # remake level
-            self.createModel()
-            self.createView()
-            startTime = pygame.time.get_ticks()
+            # restart level in place
+            self.replay()
             # new status
             status = "continue"
             running = 1
-            self.data['numAttempts'] += 1
         # new level
         if status == 'New':
             # increment level
-            self.numLevel += 1
-            if self.numLevel == 31:
-                self.numLevel = 1
+            self.numLevel = self.nextLevelNumber()
+            self.levelChanged = False
+            # level built during the menu
+            if prefetched is not None:
+                numLevel,seed,level,sim = prefetched[:4]
+                self.setLevel(seed,level)
+                self.setModel(sim)
+                # view too, unless New came before it was built
+                if len(prefetched) > 4:
+                    self.view = prefetched[4]
+                    self.view.activate()
+                else:
+                    self.createView()
             # make new level
-            self.createPoints()
-            self.createModel()
-            self.createView()
-            startTime = pygame.time.get_ticks()
+            else:
+                self.createPoints()
+                self.createModel()
+                self.createView()
             # new status
             status = "continue"
             running = 1
-            self.data['numAttempts'] += 1
+            self.data.increment('numAttempts')
         # return
         return((running,status))
 
-    def storeSeconds(self,secondsElapsed):
-        if easyControls and self.gameType == 'training':
-            self.data['easyLevelRecords'][self.numLevel-1].append(secondsElapsed)
-        elif not easyControls and self.gameType == 'training':
-            self.data['hardLevelRecords'][self.numLevel-1].append(secondsElapsed)
+    def checkLevels(self):
+        # edits to the level being played, with config.watchLevels
+        if self.numLevel in changedLevels(self.gameType):
+            self.levelChanged = True
+    
+    def replay(self):
+        '''restarts the level, keeping every drawer and scaled asset.
+        An edited level is built again, its assets still come from the caches.'''
+        self.checkLevels()
+        if self.levelChanged:
+            # same seed, so only the edits change
+            self.createPoints(self.seed)
+            self.createModel()
+            self.createView()
+            self.levelChanged = False
         else:
-            pass
+            # model and view back to level start
+            self.sim.reset()
+            self.view.reset()
+        self.data.increment('numAttempts')
+    
+    def standing(self,outcome,secondsElapsed):
+        # percent of earlier runs on this training level that were slower
+        if outcome != 'complete' or self.gameType != 'training':
+            return(None)
+        stats = self.data.levelStats(self.easyControls,self.numLevel)
+        if stats.count() == 0:
+            return(None)
+        return(int(100*stats.fasterThan(secondsElapsed)))
+    
+    def storeAttempt(self,outcome,secondsElapsed):
+        # outcome counts and training level times
+        self.data.recordAttempt(self.gameType,self.numLevel,self.easyControls,outcome,secondsElapsed,self.seed)
 
 #------------------------------------------------------------
 # run
@@ -1062,7 +1124,8 @@ if __name__ == '__main__':
     trial = GameInstance(screen,'training',3)
     # run game
     status = trial.runGame()
-    # quit
+    # quit, after every save is written
+    DataHands.store.shutdown()
     pygame.quit()
 #------------------------------------------------------------
 
@@ -0,0 +1,442 @@
+#!/usr/bin/python
+
+#------------------------------------------------------------
+# IMPORTS
+#------------------------------------------------------------
+
+# External modules
+from math import cos,sin,atan2
+
+# Internal modules
+import config
+from SpatialHash import SpatialHash
+
+# Optional modules
+try:
+    # array-backed space objects, needs numpy
+    import SpaceWorld
+except ImportError:
+    # fall back to looping over object lists
+    SpaceWorld = None
+
+#------------------------------------------------------------
+# MODEL
+#------------------------------------------------------------
+# Display-free simulation core. Nothing in this module may
+# import pygame or rely on module globals, so that many games
+# can be stepped side by side (level tuning, regression runs).
+
+#------------------------------------------------------------
+# Map Board
+class MapBoard:
+    """Size = [xmin xmax, ymin, ymax]"""
+    def __init__(self,xmax,ymax,text,text_loc,xmin=0.0,ymin=0.0):
+        # store parameters
+        self.xmin = xmin
+        self.xmax = xmax
+        self.ymin = ymin
+        self.ymax = ymax
+        self.text = text
+        self.text_loc = text_loc
+
+#------------------------------------------------------------
+# Post Ship
+class PostShip:
+    """Post delivery ship.
+    Location is (x,y) tuple.
+    Board is map board ship belongs on.
+    easyControls selects arrow key or mouse steering."""
+    def __init__(self,
+                 location,
+                 board,
+                 easyControls = True,
+                 velocity = (0,0),
+                 acceleration = (0,0),
+                 size = config.postShipSize):
+        # store parameters
+        self.x_loc, self.y_loc = location
+        self.x_vel, self.y_vel = velocity
+        self.x_acc, self.y_acc = acceleration
+        self.size = size
+        self.board = board
+        self.easyControls = easyControls
+        # start of flight, for replays
+        self.startLocation = location
+        self.startVelocity = velocity
+        # location before the last step, for drawing between steps
+        self.x_prev, self.y_prev = location
+        # engine indicators
+        if easyControls:
+            self.moveUp = False
+            self.moveDown = False
+            self.moveLeft = False
+            self.moveRight = False
+        else:
+            self.move = False
+            self.radians = 0.0
+        # indicator for waiting for level start
+        self.waiting = True
+
+    def reset(self):
+        # back to the start of the flight
+        self.x_loc, self.y_loc = self.startLocation
+        self.x_vel, self.y_vel = self.startVelocity
+        self.x_acc, self.y_acc = (0,0)
+        self.x_prev, self.y_prev = self.startLocation
+        # engines off
+        if self.easyControls:
+            self.moveUp = False
+            self.moveDown = False
+            self.moveLeft = False
+            self.moveRight = False
+        else:
+            self.move = False
+        # waiting for level start
+        self.waiting = True
+
+    def timeStep(self,dt):
+        # remember location
+        self.x_prev = self.x_loc
+        self.y_prev = self.y_loc
+        # update acceleration
+        self.x_acc, self.y_acc = self.updateAcceleration()
+        # update velocity
+        self.x_vel += self.x_acc*dt
+        self.y_vel += self.y_acc*dt
+        # update location
+        self.x_loc += self.x_vel*dt
+        self.y_loc += self.y_vel*dt
+
+    def updateAcceleration(self):
+        # EASY controls
+        if self.easyControls:
+            # vertical
+            if self.moveUp & (not self.moveDown):
+                y_acc = -config.accChange
+            elif self.moveDown & (not self.moveUp):
+                y_acc = +config.accChange
+            else:
+                y_acc = 0.0
+            # horizontal
+            if self.moveLeft & (not self.moveRight):
+                x_acc = -config.accChange
+            elif self.moveRight & (not self.moveLeft):
+                x_acc = +config.accChange
+            else:
+                x_acc = 0.0
+        # HARD controls
+        else:
+            # engine on
+            if self.move:
+                # vertical
+                y_acc = -cos(self.radians)*config.accChange
+                # horizontal
+                x_acc = -sin(self.radians)*config.accChange
+            # engine off
+            else:
+                x_acc = 0.0
+                y_acc = 0.0
+        # indicator for waiting for level start
+        if self.waiting and (x_acc != 0.0 or y_acc != 0.0):
+            self.waiting = False
+        # return
+        return((x_acc,y_acc))
+
+    def drawLocation(self, alpha=1.0):
+        # blend between last two steps, alpha = 1 is the current step
+        x_loc = self.x_prev + (self.x_loc - self.x_prev)*alpha
+        y_loc = self.y_prev + (self.y_loc - self.y_prev)*alpha
+        return((x_loc,y_loc))
+
+    def pointAt(self, target):
+        # target location in model coordinates
+        target_x, target_y = target
+        # calculate radians
+        change_y = self.y_loc - target_y
+        change_x = self.x_loc - target_x
+        self.radians = atan2(change_x,change_y)
+
+    def lostInSpace(self):
+        # has post ship left the board?
+        if   self.x_loc > self.board.xmax + self.size/2.0:
+            return(True)
+        elif self.x_loc < self.board.xmin - self.size/2.0:
+            return(True)
+        elif self.y_loc > self.board.ymax + self.size/2.0:
+            return(True)
+        elif self.y_loc < self.board.ymin - self.size/2.0:
+            return(True)
+        else:
+            return(False)
+
+#------------------------------------------------------------
+# Post Box
+class PostBox:
+    """Location for post ship deliveries.
+    Location is (x,y) tuple.
+    Board is map board post box belongs on."""
+    def __init__(self,location, board,
+                 innerSize = config.postBoxInnerSize, outerSize = config.postBoxOuterSize):
+        # store parameters
+        self.x_loc, self.y_loc = location
+        self.board = board
+        self.innerSize = innerSize
+        self.outerSize = outerSize
+        self.delivered = False
+
+    def reset(self):
+        # awaiting delivery again
+        self.delivered = False
+
+    def timeStep(self,postShip):
+        # distance to postship
+        dist = (postShip.x_loc - self.x_loc)**2 + (postShip.y_loc - self.y_loc)**2
+        limit = (self.outerSize/2.0)**2
+        # check for delivery
+        if dist < limit and not self.delivered:
+            self.delivered = True
+
+    def collisionCheck(self,postShip):
+        # distance to postship
+        dist = (postShip.x_loc - self.x_loc)**2 + (postShip.y_loc - self.y_loc)**2
+        limit = (self.innerSize/2.0 + postShip.size/2.0)**2
+        # check for collision
+        return(dist < limit and config.precisionDelivery)
+
+    def reach(self):
+        # furthest a ship centre can be and still interact
+        return(max(self.outerSize,self.innerSize)/2.0)
+
+#------------------------------------------------------------
+# Asteroid
+class AsteroidHazard:
+    """Asteriod hazard for postship.
+    Location is (x,y) tuple.
+    Board is map board asteroid belongs on."""
+    def __init__(self,location, board,
+                 size = config.asteroidSize):
+        # store parameters
+        self.x_loc, self.y_loc = location
+        self.board = board
+        self.size = size
+        self.delivered = True
+
+    def reset(self):
+        pass
+
+    def timeStep(self,postShip):
+        pass
+
+    def collisionCheck(self,postShip):
+        # distance to postship
+        dist = (postShip.x_loc - self.x_loc)**2 + (postShip.y_loc - self.y_loc)**2
+        limit = (self.size/2.0 + postShip.size/2.0)**2
+        # check for collision
+        if dist < limit:
+            return(True)
+        else:
+            return(False)
+
+    def reach(self):
+        # furthest a ship centre can be and still interact
+        return(self.size/2.0)
+
+#------------------------------------------------------------
+# Warp out
+class WarpOut:
+    """End of level warp out.
+    Location is (x,y) tuple.
+    Board is map board warp out belongs on."""
+    def __init__(self,location, board,
+                 outerSize = config.warpOutOuterSize,
+                 innerSize = config.warpOutInnerSize):
+        # store parameters
+        self.x_loc, self.y_loc = location
+        self.board = board
+        self.outerSize = outerSize
+        self.innerSize = innerSize
+        self.delivered = True
+
+    def reset(self):
+        pass
+
+    def timeStep(self,postShip):
+        pass
+
+    def collisionCheck(self,postShip):
+        # distance to postship
+        dist = (postShip.x_loc - self.x_loc)**2 + (postShip.y_loc - self.y_loc)**2
+        limit = (self.innerSize/2.0 + postShip.size/2.0)**2
+        # check for collision
+        if dist < limit:
+            return(True)
+        else:
+            return(False)
+
+#------------------------------------------------------------
+# SIMULATION
+#------------------------------------------------------------
+
+#------------------------------------------------------------
+# Simulation instance
+class SimulationInstance:
+    """Steps one game without any display.
+    Required input:
+    - level tuple as returned by LevelsLoader.getLevel
+    - control scheme (easy or hard)
+    Subclasses may swap the model classes to attach drawers."""
+    # model classes
+    boardClass    = MapBoard
+    postShipClass = PostShip
+    postBoxClass  = PostBox
+    asteroidClass = AsteroidHazard
+    warpOutClass  = WarpOut
+
+    def __init__(self,level,easyControls=True):
+        # store parameters
+        self.level = level
+        self.easyControls = easyControls
+        # game model
+        self.createModel()
+
+    def createModel(self):
+        # unpack level
+        xmax,ymax,postShip_loc,warpOut_loc,postBox_locs,asteroid_locs,text,text_loc = self.level
+        # new map board
+        self.board = self.boardClass(xmax,ymax,text,text_loc)
+        # new post ship
+        self.postShip = self.postShipClass(postShip_loc,self.board,self.easyControls)
+        # new warp out
+        self.warpOut = self.warpOutClass(warpOut_loc,self.board)
+        # other space objects
+        self.spaceObjects = []
+        # add post boxes
+        for loc in postBox_locs:
+            # new post box
+            self.spaceObjects.append(self.postBoxClass(loc,self.board))
+        # add remaining asteroid hazard
+        for loc in asteroid_locs:
+            # new asteroid
+            self.spaceObjects.append(self.asteroidClass(loc,self.board))
+        # broadphase grid, objects are static so built once per level
+        self.index = SpatialHash()
+        for i in range(len(self.spaceObjects)):
+            obj = self.spaceObjects[i]
+            self.index.insert(i,obj.x_loc,obj.y_loc,obj.reach())
+        # array-backed copy for vectorized checks on busy boards
+        if SpaceWorld is not None and len(self.spaceObjects) >= config.worldArrayMinObjects:
+            self.world = SpaceWorld.WorldArrays(self.spaceObjects,self.postShip.size,self.index)
+        else:
+            self.world = None
+        # simulated seconds since the ship first moved
+        self.simTime = 0.0
+        # real seconds not yet stepped
+        self.accumulator = 0.0
+
+    def reset(self):
+        """Puts the level back to its start in place. No objects are
+        made, so drawers attached to them stay valid."""
+        # model objects
+        self.postShip.reset()
+        self.warpOut.reset()
+        for obj in self.spaceObjects:
+            obj.reset()
+        # array copy follows the objects
+        if self.world is not None:
+            self.world.reset()
+        # clocks
+        self.simTime = 0.0
+        self.accumulator = 0.0
+
+    def step(self,dt=config.dt):
+        # increment model time
+        # for post ship
+        self.postShip.timeStep(dt)
+        # for space objects
+        if self.world is not None:
+            self.world.timeStep(self.postShip)
+        else:
+            for obj in self.nearbyObjects():
+                obj.timeStep(self.postShip)
+        # track flight time
+        if not self.postShip.waiting:
+            self.simTime += dt
+        # check for game over conditions
+        return(self.checkEndGameConditions())
+
+    def advance(self,realSeconds,timeScale=1.0):
+        """Takes as many fixed steps as realSeconds covers, so physics
+        runs at config.simRate whatever the frame rate. Leftover time is
+        kept for the next call and sets the interpolation for drawing."""
+        # seconds per fixed step
+        stepSeconds = 1.0 / config.simRate
+        # long stalls (menus, window drags) are not caught up
+        self.accumulator += min(realSeconds, config.maxFrameTime) * timeScale
+        # fixed steps
+        status = 'continue'
+        while self.accumulator >= stepSeconds and status == 'continue':
+            status = self.step(config.dt)
+            self.accumulator -= stepSeconds
+        # return status of last step
+        return(status)
+
+    def flightSeconds(self):
+        # flight time at normal speed, counted in fixed steps so it matches the simulation
+        return(self.simTime / (config.dt*config.simRate))
+
+    def interpolation(self):
+        # fraction of the next step already elapsed
+        return(min(self.accumulator * config.simRate, 1.0))
+
+    def checkEndGameConditions(self):
+        # default = no change
+        status = 'continue'
+        # lost in space
+        if self.postShip.lostInSpace():
+            # we are lost
+            status = 'lost'
+        # collision
+        if self.world is not None:
+            collision = self.world.collisionCheck(self.postShip)
+        else:
+            collision = any([obj.collisionCheck(self.postShip) for obj in self.nearbyObjects()])
+        if collision:
+            # we have crashed
+            status = 'crashed'
+        # all mail delivered
+        atWormHole = self.warpOut.collisionCheck(self.postShip)
+        if atWormHole and not self.allDelivered():
+            # we have warped out early
+            status = 'early'
+        elif atWormHole:
+            # we have completed mail run
+            status = 'complete'
+        # all conditions checked
+        return(status)
+
+    def nearbyObjects(self):
+        # broadphase candidates around the ship
+        keys = self.index.query(self.postShip.x_loc,self.postShip.y_loc,self.postShip.size/2.0)
+        return([self.spaceObjects[i] for i in keys])
+
+    def allDelivered(self):
+        # only needed at the warp out, so a full pass is fine
+        if self.world is not None:
+            return(self.world.allDelivered())
+        return(all([obj.delivered for obj in self.spaceObjects]))
+
+    def run(self,controller=None,maxSteps=10000,dt=config.dt):
+        """Steps uncapped until the game ends or maxSteps is reached.
+        controller(sim) is called before every step to set the controls."""
+        # keep stepping
+        status = 'continue'
+        numSteps = 0
+        while status == 'continue' and numSteps < maxSteps:
+            # set controls
+            if controller is not None:
+                controller(self)
+            # advance
+            status = self.step(dt)
+            numSteps += 1
+        # return final status
+        return(status)
@@ -5,13 +5,16 @@
 #------------------------------------------------------------
 
 # External modules
+import multiprocessing
 import pygame
 
 # Internal modules
 import config
 from SpaceDelivery import GameInstance
 from MenuMaker import MenuInstance
+from LevelPool import LevelPool
 import DataHands
+import AssetManager
 
 #------------------------------------------------------------
 # Load welcome screen
@@ -19,10 +22,11 @@ import DataHands
 def setup(screen):
     welcomeMenuBackground = loadAssets()
     welcomeMenuBackground = scaleAssets(welcomeMenuBackground,screen)
-    pygame.image.save(welcomeMenuBackground,config.tmpWelcomeMBack)
+    # kept in memory for every welcome menu
+    return(welcomeMenuBackground)
 
 def loadAssets():
-    welcomeBackground = pygame.image.load(config.welcomeMenuBack)
+    welcomeBackground = AssetManager.loadImage(config.welcomeMenuBack)
     return(welcomeBackground)
 
 def scaleAssets(background,screen):
@@ -34,7 +38,7 @@ def scaleAssets(background,screen):
     # rescale to match height
     newHeight = int(0.5 + backgroundHeight*rescaleRatio)
     newWidth  = int(0.5 + background.get_width()*rescaleRatio)
-    background = pygame.transform.smoothscale(background, (newWidth, newHeight))
+    background = AssetManager.getImage(config.welcomeMenuBack, (newWidth, newHeight), 0, None, True)
     
     # widths
     backgroundWidth = background.get_width()
@@ -52,19 +56,17 @@ def scaleAssets(background,screen):
 def makeMenuButtons():
     # menu buttons
     menuButtons = ['Campeign','Random','Mode = Hard','Exit']
-    # load data
-    data = DataHands.loadJson()
     # easy mode
-    if data['easyControls']:
+    if DataHands.store.get('easyControls'):
         menuButtons[2] = 'Mode = Easy'
     # return
     return(menuButtons)
 
-def makeMenu(screen):
+def makeMenu(screen,background):
     # menu buttons
     menuButtons = makeMenuButtons()
     # call menu
-    MI = MenuInstance(screen, '', '',menuButtons,config.tmpWelcomeMBack)
+    MI = MenuInstance(screen, '', '',menuButtons,background)
     # return
     return(MI)
 
@@ -82,16 +84,14 @@ def handleStatus(running,status):
         status = GI.runGame()
     elif status == 'Mode = Easy':
         # change to hard mode
-        data = DataHands.loadJson()
-        data['easyControls'] = False
-        DataHands.saveJson(data)
+        DataHands.store.set('easyControls',False)
+        DataHands.store.flush()
         # return status to continue
         status = 'continue'
     elif status == 'Mode = Hard':
         # change to easy mode
-        data = DataHands.loadJson()
-        data['easyControls'] = True
-        DataHands.saveJson(data)        
+        DataHands.store.set('easyControls',True)
+        DataHands.store.flush()
         # return status to continue
         status = 'continue'
     elif status == 'Exit' or status == 'quit':
@@ -106,6 +106,8 @@ def handleStatus(running,status):
 # Run
 
 if __name__ == '__main__':
+    # level pool workers in the stand-alone executable
+    multiprocessing.freeze_support()
     # initialize
     pygame.init()
     # create screen
@@ -117,17 +119,21 @@ if __name__ == '__main__':
         screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
     
     # setup
-    setup(screen)
+    welcomeMenuBackground = setup(screen)
+    levelPool = LevelPool()
+    levelPool.start()
     running = 1
     status = 'continue'
     
     # keep looping through
     while running == 1:
         # make menu
-        MI = makeMenu(screen)
+        MI = makeMenu(screen,welcomeMenuBackground)
         status = MI.run(True)
         # resolve status
         running,status = handleStatus(running,status)
         
-    # quit
+    # quit, after every save is written
+    DataHands.store.shutdown()
+    levelPool.shutdown()
     pygame.quit()
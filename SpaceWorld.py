@@ -0,0 +1,132 @@
+#!/usr/bin/python
+
+#------------------------------------------------------------
+# IMPORTS
+#------------------------------------------------------------
+
+# External modules
+import numpy
+
+# Internal modules
+import config
+import SpaceModel
+from SpatialHash import SpatialHash
+
+#------------------------------------------------------------
+# Parameters
+
+# kind flags
+KIND_POSTBOX  = 1
+KIND_ASTEROID = 2
+
+#------------------------------------------------------------
+# WORLD STATE
+#------------------------------------------------------------
+
+#------------------------------------------------------------
+# World arrays
+class WorldArrays:
+    """Array-backed copy of the space objects on a board.
+    Positions, radii, kind flags and the delivered mask are held in
+    contiguous arrays so delivery and collision tests cost one
+    vectorized pass however many objects the level has.
+    The model objects stay authoritative for drawing, newly
+    delivered post boxes are written back to them."""
+    def __init__(self,spaceObjects,shipSize=config.postShipSize,index=None):
+        # store parameters
+        self.objects = list(spaceObjects)
+        self.shipSize = shipSize
+        # number of objects
+        numObjects = len(self.objects)
+        # allocate arrays
+        self.positions = numpy.zeros((numObjects,2))
+        self.kinds = numpy.zeros(numObjects, dtype=numpy.int8)
+        self.collisionRadii = numpy.zeros(numObjects)
+        self.deliveryRadii = numpy.zeros(numObjects)
+        self.delivered = numpy.ones(numObjects, dtype=bool)
+        # fill from objects
+        for i in range(numObjects):
+            self.store(i,self.objects[i])
+        self.numUndelivered = int(numObjects - self.delivered.sum())
+        # squared limits against the ship
+        self.computeLimits()
+        # broadphase grid keyed by array index
+        if index is None:
+            index = SpatialHash()
+            for i in range(numObjects):
+                index.insert(i,self.objects[i].x_loc,self.objects[i].y_loc,self.objects[i].reach())
+        self.index = index
+        # last ship location distances were computed for
+        self.shipLoc = None
+        self.nearby = None
+        self.shipDist = None
+
+    def store(self,i,obj):
+        # location
+        self.positions[i] = (obj.x_loc,obj.y_loc)
+        # post boxes
+        if isinstance(obj,SpaceModel.PostBox):
+            self.kinds[i] = KIND_POSTBOX
+            self.deliveryRadii[i] = obj.outerSize/2.0
+            # inner box only collides for precision delivery
+            if config.precisionDelivery:
+                self.collisionRadii[i] = obj.innerSize/2.0
+            else:
+                self.collisionRadii[i] = -1.0
+            self.delivered[i] = obj.delivered
+        # asteroids
+        elif isinstance(obj,SpaceModel.AsteroidHazard):
+            self.kinds[i] = KIND_ASTEROID
+            self.collisionRadii[i] = obj.size/2.0
+            self.deliveryRadii[i] = -1.0
+            self.delivered[i] = True
+        else:
+            assert False, 'space object not recognized'
+
+    def computeLimits(self):
+        # collision when closer than both radii, never for negative radii
+        collides = self.collisionRadii >= 0
+        self.collisionLimits = numpy.where(collides, (self.collisionRadii + self.shipSize/2.0)**2, -1.0)
+        # delivery inside outer radius
+        self.deliveryLimits = numpy.where(self.deliveryRadii >= 0, self.deliveryRadii**2, -1.0)
+
+    def distances(self,postShip):
+        # reuse distances if the ship has not moved
+        shipLoc = (postShip.x_loc,postShip.y_loc)
+        if shipLoc != self.shipLoc:
+            # broadphase candidates around the ship
+            keys = self.index.query(shipLoc[0],shipLoc[1],self.shipSize/2.0)
+            self.nearby = numpy.array(keys, dtype=numpy.intp)
+            # squared distance from ship to every candidate
+            change = self.positions[self.nearby] - shipLoc
+            self.shipDist = numpy.einsum('ij,ij->i',change,change)
+            self.shipLoc = shipLoc
+        return((self.nearby,self.shipDist))
+
+    def timeStep(self,postShip):
+        # post boxes reached this step
+        nearby, dist = self.distances(postShip)
+        reached = (dist < self.deliveryLimits[nearby]) & ~self.delivered[nearby]
+        if not reached.any():
+            return(False)
+        # update mask and model objects
+        newlyDelivered = nearby[reached]
+        self.delivered[newlyDelivered] = True
+        self.numUndelivered -= len(newlyDelivered)
+        for i in newlyDelivered:
+            self.objects[i].delivered = True
+        return(True)
+
+    def collisionCheck(self,postShip):
+        # check for collision
+        nearby, dist = self.distances(postShip)
+        return(bool((dist < self.collisionLimits[nearby]).any()))
+
+    def allDelivered(self):
+        return(self.numUndelivered == 0)
+
+    def reset(self):
+        # copy delivered state back from model objects
+        for i in range(len(self.objects)):
+            self.delivered[i] = self.objects[i].delivered
+        self.numUndelivered = int(len(self.objects) - self.delivered.sum())
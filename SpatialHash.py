@@ -0,0 +1,85 @@
+#!/usr/bin/python
+
+#------------------------------------------------------------
+# IMPORTS
+#------------------------------------------------------------
+
+# External modules
+from math import floor
+
+# Internal modules
+import config
+
+#------------------------------------------------------------
+# SPATIAL INDEX
+#------------------------------------------------------------
+
+#------------------------------------------------------------
+# Spatial hash
+class SpatialHash:
+    """Uniform grid broadphase for circles on the board.
+    Every entry is stored in each cell its bounding box touches,
+    a query returns the keys stored in the cells around a point.
+    Candidates still need an exact distance test."""
+    def __init__(self,cellSize=config.spatialCellSize):
+        # store parameters
+        self.cellSize = float(cellSize)
+        # cell (i,j) -> list of keys
+        self.cells = {}
+        # key -> (cells, x, y, radius)
+        self.entries = {}
+
+    def cellsCovering(self,x,y,radius):
+        # grid range of bounding box
+        iMin = int(floor((x - radius) / self.cellSize))
+        iMax = int(floor((x + radius) / self.cellSize))
+        jMin = int(floor((y - radius) / self.cellSize))
+        jMax = int(floor((y + radius) / self.cellSize))
+        # list cells
+        return([(i,j) for i in range(iMin,iMax+1) for j in range(jMin,jMax+1)])
+
+    def insert(self,key,x,y,radius):
+        # replace any earlier entry
+        if key in self.entries:
+            self.remove(key)
+        # add to every covered cell
+        cells = self.cellsCovering(x,y,radius)
+        for cell in cells:
+            self.cells.setdefault(cell,[]).append(key)
+        # remember where it went
+        self.entries[key] = (cells,x,y,radius)
+
+    def remove(self,key):
+        # drop from its cells
+        cells = self.entries.pop(key)[0]
+        for cell in cells:
+            keys = self.cells[cell]
+            keys.remove(key)
+            if not keys:
+                del self.cells[cell]
+
+    def move(self,key,x,y,radius=None):
+        # keep radius unless changed
+        oldCells, old_x, old_y, oldRadius = self.entries[key]
+        if radius is None:
+            radius = oldRadius
+        # only touch the grid if the covered cells change
+        cells = self.cellsCovering(x,y,radius)
+        if cells == oldCells:
+            self.entries[key] = (oldCells,x,y,radius)
+        else:
+            self.insert(key,x,y,radius)
+
+    def query(self,x,y,radius=0.0):
+        # single cell is by far the common case
+        cells = self.cellsCovering(x,y,radius)
+        if len(cells) == 1:
+            return(list(self.cells.get(cells[0],())))
+        # merge keys from all cells without duplicates
+        found = set()
+        for cell in cells:
+            found.update(self.cells.get(cell,()))
+        return(list(found))
+
+    def __len__(self):
+        return(len(self.entries))
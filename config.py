@@ -8,9 +8,13 @@
 #------------------------------------------------------------
 # Parameters
 
-FPS = 40
-dt = 0.05
+FPS = 40 ## render rate cap, 0 for uncapped
+dt = 0.05 ## simulated seconds per physics step
+simRate = 40 ## physics steps per real second
+simSpeed = 1.0 ## real time multiplier, above 1 to fast forward
+maxFrameTime = 0.25 ## longest real frame the physics catches up on
 windowed = False
+dirtyRects = True ## only send changed screen areas to the display
 
 # gameplay
 ##easyControls = False
@@ -34,6 +38,14 @@ waitingSize = 180
 shareText = 0.33
 shareButtons = 0.67
 menuFontSize = 80
+menuWaitTime = 1000 ## longest wait for input before the menu checks in, milliseconds
+# fonts
+fontFile = 'FreeSansBold.ttf'
+textCacheSize = 64 ## rendered text surfaces kept
+# images
+assetCacheBytes = 256*1024*1024 ## decoded and scaled images kept
+rotationSteps = 180 ## angles kept for sprites that turn, 2 degrees apart
+warmRotations = True ## make every angle at level start instead of on first use
 # menu buttons
 buttonWidth = 222
 buttonHeight = 100
@@ -43,8 +55,30 @@ xmax = 18
 ymax = 15
 numPostBox = 3
 numAsteroid = 3
-# number of levels made
+randomLevelSpacing = 2.0 ## minimum distance between random objects
+randomLevelDarts = 30 ## random throws per object before switching to poisson disk
+randomLevelAttempts = 10 ## poisson disk fills before giving up on a small board
+# random level pool
+levelPoolSize = 20 ## validated random levels kept on disk
+levelPoolWorkers = 2 ## processes making levels in the background
+levelPoolTries = 100 ## seeds tried per level before giving up
+solverMargin = 0.1 ## extra clearance for the solvability check
+solverGridStep = 0.5 ## waypoint spacing for the solvability check
+# training levels a new data file has room for, more are added as they are played
 numLevelsMade = 30
+watchLevels = False ## recompile edited level sources and load them on replay
+# saved data
+journalCompactSize = 200 ## journal entries before folding into the data file
+writerQueueSize = 64 ## saves waiting for the background writer
+useScoreDatabase = False ## also keep every flight in a SQLite database
+profileName = 'player' ## profile flights are stored under
+maxLevelRecords = None ## only keep this many latest times per level, None keeps them all
+statsBins = 64 ## histogram bins for level time percentiles
+statsMinSeconds = 0.5 ## histogram covers this many seconds
+statsMaxSeconds = 300.0 ## up to this many, longer times share the last bin
+# simulation
+worldArrayMinObjects = 24 ## numpy arrays only pay off on busy boards
+spatialCellSize = 4.0 ## broadphase grid cell, at least twice the largest object reach
 
 #------------------------------------------------------------
 # Colours
@@ -55,6 +89,7 @@ BLUE      = (  0,  0,255)
 GREEN     = (  0,255,  0)
 WHITE     = (255,255,255)
 LIGHTGREY = (200,200,200)
+DARKGREY  = ( 60, 60, 60)
 TEAL      = (  0,250,100)
 BROWN     = (139, 69, 19)
 # transparent
@@ -68,11 +103,17 @@ transRED       = (155,  0,  0, 90)
 
 # data file for saving setting and scores
 dataLocation    = "Resources/data.json"
+# changes since data file was last written
+journalLocation = "Resources/data.journal"
+# every flight, when the score database is used
+scoreDatabaseLocation = "Resources/scores.sqlite"
+# pre-made random levels
+levelPoolFolder = "Resources/LevelPool"
+# level sources, one folder of json files per level type, compiled to <type>.pack
+levelsFolder    = "Resources/Levels"
 # back ground
 starBackground  = "Resources/Images/StarsBackground.png"
-tmpMenuBackgrd  = "Resources/Images/tmpMenuBackground.png"
 welcomeMenuBack = "Resources/Images/welcomeMenuBackground.png"
-tmpWelcomeMBack = "Resources/Images/tmpWelcomeMenuBackground.png"
 # ships
 easyShip        = "Resources/Images/ShipEasy_alpha.png"
 hardShip        = "Resources/Images/ShipHard_alpha.png"